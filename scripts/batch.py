@@ -0,0 +1,119 @@
+import json
+from denoise import get_denoise_settings
+from encode_search import get_search_target
+from session import IMPORT_MODES, ensure_path
+from workers import EXECUTOR_BACKENDS
+
+try:
+    import yaml
+except ImportError:
+    yaml = None
+
+# Modo batch: o arquivo é uma lista de ações ou {"jobs": [...], "steps": [...]}.
+# Cada ação usa os mesmos nomes de parâmetro da linha de comando (--action resize --width 50 ...).
+# Cada job é um conjunto de entrada (mesmos parâmetros de importação da inicialização) e
+# "{job}" em parâmetros de texto é trocado pelo nome do job (ex.: output_directory_path).
+
+JOB_KEYS = ['name', 'images_path', 'pdf']
+# Chaves aceitas em qualquer ação, além dos parâmetros próprios
+STEP_KEYS = ['action', 'executor']
+
+def load_batch_file(path):
+    path = ensure_path(path)
+    text = path.read_text()
+
+    if path.suffix.lower() in ('.yaml', '.yml'):
+        if yaml is None:
+            raise ValueError('PyYAML não instalado: use um arquivo .json ou instale pyyaml')
+        return yaml.safe_load(text)
+    return json.loads(text)
+
+def as_path_list(value):
+    return [value] if isinstance(value, str) else list(value or [])
+
+def get_job_name(job, index):
+    if job.get('name'):
+        return str(job.get('name'))
+    paths = as_path_list(job.get('images_path'))
+    return ensure_path(paths[0]).stem if paths else f'job_{index}'
+
+def get_batch_jobs(batch, args_dict, import_params):
+    # Jobs do arquivo; senão, da linha de comando: --jobs (um conjunto por caminho) ou --images_path (um só)
+    if isinstance(batch, dict) and batch.get('jobs') is not None:
+        return batch.get('jobs')
+
+    import_args = {key: args_dict[key] for key in ['pdf'] + import_params if key in args_dict}
+    if args_dict.get('jobs') is not None:
+        return [import_args | {'images_path': path} for path in as_path_list(args_dict.get('jobs'))]
+    if args_dict.get('images_path') is not None:
+        return [import_args | {'images_path': args_dict.get('images_path')}]
+    return []
+
+def get_batch_steps(batch):
+    return batch.get('steps') if isinstance(batch, dict) else batch
+
+def validate_batch(jobs, steps, action_params, import_params):
+    # Valida tudo antes de começar: um erro de digitação não pode derrubar o job 40 de madrugada
+    errors = []
+
+    if not isinstance(steps, list) or not steps:
+        errors.append('Nenhuma ação definida (lista de ações ou chave "steps")')
+        steps = []
+
+    for index, step in enumerate(steps):
+        if not isinstance(step, dict) or 'action' not in step:
+            errors.append(f'Ação {index + 1}: esperado objeto com "action"')
+            continue
+        action = step.get('action')
+        if action not in action_params:
+            errors.append(f"Ação {index + 1}: ação desconhecida '{action}'")
+            continue
+        for key in step:
+            if key not in STEP_KEYS and key not in action_params[action]:
+                errors.append(f"Ação {index + 1} ({action}): parâmetro desconhecido '{key}'")
+        if step.get('executor', 'auto') not in EXECUTOR_BACKENDS:
+            errors.append(f"Ação {index + 1} ({action}): executor inválido '{step.get('executor')}' (use {', '.join(EXECUTOR_BACKENDS)})")
+        if action == 'remove_noise':
+            try:
+                get_denoise_settings(**{key: value for key, value in step.items() if key in action_params[action]})
+            except ValueError as e:
+                errors.append(f'Ação {index + 1} ({action}): {e}')
+        if action in ('to_jpeg', 'to_avif'):
+            try:
+                get_search_target(step.get('target_kb'), step.get('target_ssim'))
+            except ValueError as e:
+                errors.append(f'Ação {index + 1} ({action}): {e}')
+
+    if not isinstance(jobs, list) or not jobs:
+        errors.append('Nenhum job de entrada (chave "jobs", --jobs ou --images_path)')
+        jobs = []
+
+    allowed_job_keys = JOB_KEYS + import_params
+    names = set()
+    for index, job in enumerate(jobs):
+        if not isinstance(job, dict):
+            errors.append(f'Job {index + 1}: esperado objeto')
+            continue
+        name = get_job_name(job, index + 1)
+        if name in names:
+            errors.append(f"Job {index + 1}: nome repetido '{name}'")
+        names.add(name)
+        for key in job:
+            if key not in allowed_job_keys:
+                errors.append(f"Job {index + 1} ({name}): parâmetro desconhecido '{key}'")
+        if job.get('import_mode', 'auto') not in IMPORT_MODES:
+            errors.append(f"Job {index + 1} ({name}): import_mode inválido '{job.get('import_mode')}' (use {', '.join(IMPORT_MODES)})")
+        paths = as_path_list(job.get('images_path'))
+        if not paths:
+            errors.append(f'Job {index + 1} ({name}): sem images_path')
+        for path in paths:
+            if not ensure_path(path).exists():
+                errors.append(f"Job {index + 1} ({name}): caminho não encontrado '{path}'")
+
+    return errors
+
+def format_step(step, job_name):
+    return {
+        key: value.replace('{job}', job_name) if isinstance(value, str) else value
+        for key, value in step.items()
+    }
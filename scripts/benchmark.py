@@ -0,0 +1,333 @@
+import json
+import platform
+import resource
+import shlex
+import shutil
+import subprocess
+import sys
+import time
+from datetime import datetime, timezone
+from pathlib import Path
+import fitz
+import numpy as np
+from PIL import Image
+import cache
+import cv2
+from debug_log import print_log
+from denoise import DENOISE_ALGORITHMS, apply_denoise, get_denoise_settings
+from input_parser import parse_args
+from image_utils import convert_images_to_avif, convert_images_to_jpeg, edit_border_images, export_to_pdf, export_to_word, images_from_grid, images_to_grid, import_images, import_images_from_pdf, noise_images, resize_images
+from session import DATA_FOLDER_PATH, ensure_path, get_session_path, new_dir, new_session
+from workers import get_worker_pids, shutdown_pool, start_pool
+
+# Uso (a partir da raiz do repositório):
+# python scripts/benchmark.py --output bench.json --workers 1 4 --batch 1 8 32
+# python scripts/benchmark.py --output new.json --compare bench.json --threshold 0.15
+# python scripts/benchmark.py --actions remove_noise_legacy remove_noise_bilateral --denoise_quality
+
+BENCHMARK_FOLDER_PATH = DATA_FOLDER_PATH / "benchmark"
+CORPUS_SEED = 1234
+CORPUS_SIZES = [(640, 480), (1200, 1600), (2480, 3508)]
+CORPUS_MODES = ["RGB", "RGBA", "L"]
+CORPUS_FORMATS = ["PNG", "JPEG"]
+CORPUS_PDFS = 2
+CORPUS_PDF_PAGES = 6
+LATENCY_SAMPLES = 8
+DENOISE_NOISE_SIGMA = 12  # ruído gaussiano somado ao corpus para medir a qualidade da remoção
+
+def synthetic_image(rng, size, mode):
+    width, height = size
+    # Gradiente suave + formas + ruído: comprime como uma carta escaneada, não como ruído puro
+    y, x = np.mgrid[0:height, 0:width].astype(np.float32)
+    base = np.stack([x / width, y / height, (x + y) / (width + height)], axis=2) * 200
+    for _ in range(6):
+        cx, cy, radius = rng.integers(0, width), rng.integers(0, height), rng.integers(20, max(21, width // 4))
+        mask = (x - cx) ** 2 + (y - cy) ** 2 < radius ** 2
+        base[mask] = rng.integers(0, 255, 3)
+    base += rng.normal(0, 6, base.shape)
+    rgb = np.clip(base, 0, 255).astype(np.uint8)
+
+    img = Image.fromarray(rgb, "RGB")
+    if mode == "RGBA":
+        alpha = np.full((height, width), 255, np.uint8)
+        alpha[: height // 10] = 0
+        alpha[-height // 10:] = 0
+        img.putalpha(Image.fromarray(alpha, "L"))
+    elif mode == "L":
+        img = img.convert("L")
+    return img
+
+def generate_corpus(corpus_path, seed = CORPUS_SEED):
+    corpus_path = ensure_path(corpus_path)
+    images_path = corpus_path / "images"
+    pdfs_path = corpus_path / "pdfs"
+    if images_path.is_dir() and pdfs_path.is_dir():
+        return images_path, sorted(pdfs_path.glob("*.pdf"))
+
+    new_dir(corpus_path, "images")
+    new_dir(corpus_path, "pdfs")
+    rng = np.random.default_rng(seed)
+
+    for size in CORPUS_SIZES:
+        for mode in CORPUS_MODES:
+            for format in CORPUS_FORMATS:
+                if format == "JPEG" and mode == "RGBA":
+                    continue
+                img = synthetic_image(rng, size, mode)
+                ext = "jpg" if format == "JPEG" else "png"
+                img.save(images_path / f"{size[0]}x{size[1]}_{mode}.{ext}", format=format, dpi=(300, 300))
+
+    image_files = sorted(images_path.iterdir())
+    for pdf_index in range(CORPUS_PDFS):
+        pdf_doc = fitz.open()
+        for page_index in range(CORPUS_PDF_PAGES):
+            page = pdf_doc.new_page(width=595, height=842)
+            page.insert_text((72, 72), f"Benchmark {pdf_index} - {page_index + 1}")
+            image_file = image_files[(pdf_index * CORPUS_PDF_PAGES + page_index) % len(image_files)]
+            page.insert_image(fitz.Rect(72, 100, 523, 770), filename=str(image_file), keep_proportion=True)
+        pdf_doc.save(pdfs_path / f"deck_{pdf_index}.pdf")
+        pdf_doc.close()
+
+    print_log(f"Corpus gerado em {corpus_path}", title="Benchmark")
+    return images_path, sorted(pdfs_path.glob("*.pdf"))
+
+def get_actions(session_id, output_path, pdfs):
+    # Cada ação recebe um lote (lista de image_info ou de PDFs) e retorna quantos itens processou
+    return {
+        'resize': lambda batch: resize_images(batch, width=50, height=50, scale='percentage'),
+        'crop_cut': lambda batch: edit_border_images(batch, left=10, right=10, top=10, bottom=10),
+        'crop_trim': lambda batch: edit_border_images(batch, type='trim'),
+        'crop_bg': lambda batch: edit_border_images(batch, type='bg', color='#FFFFFF', threshold=30),
+        'remove_noise': lambda batch: noise_images(batch),
+        **{
+            f'remove_noise_{algorithm}': lambda batch, algorithm = algorithm: noise_images(batch, algorithm=algorithm)
+            for algorithm in DENOISE_ALGORITHMS
+        },
+        'to_jpeg': lambda batch: convert_images_to_jpeg(batch),
+        'to_avif': lambda batch: convert_images_to_avif(batch, speed=8),
+        'to_grid': lambda batch: images_to_grid(batch, rows=3, cols=3),
+        'from_grid': lambda batch: images_from_grid(batch, rows=2, cols=2),
+        'to_pdf': lambda batch: export_to_pdf(batch, output_path, file_name='benchmark'),
+        'to_word': lambda batch: export_to_word(batch, output_path, file_name='benchmark'),
+        'import_pdf': lambda batch: import_images_from_pdf(session_id, batch, page_as_image=True, dpi=150)
+    }
+
+def get_default_actions():
+    # As variantes por algoritmo de remove_noise só rodam quando pedidas em --actions
+    return [action for action in get_actions(None, None, None) if not action.startswith('remove_noise_')]
+
+def run_denoise_quality(corpus_path, seed = CORPUS_SEED):
+    # Qualidade x velocidade em processo único: cada imagem do corpus vira referência, recebe ruído
+    # conhecido e cada algoritmo é comparado à referência (PSNR) e à saída antiga (legacy)
+    images_path, _ = generate_corpus(corpus_path)
+    rng = np.random.default_rng(seed)
+    samples = []
+    for path in sorted(images_path.iterdir())[:LATENCY_SAMPLES]:
+        with Image.open(path) as img:
+            reference = np.asarray(img.convert('RGB'))
+        noisy = np.clip(reference + rng.normal(0, DENOISE_NOISE_SIGMA, reference.shape), 0, 255).astype(np.uint8)
+        samples.append((reference, noisy))
+
+    legacy_outputs = [apply_denoise(noisy, get_denoise_settings('legacy')) for _, noisy in samples]
+    results = []
+    for algorithm in DENOISE_ALGORITHMS:
+        settings = get_denoise_settings(algorithm)
+        seconds = 0
+        psnr = []
+        psnr_legacy = []
+        for (reference, noisy), legacy_output in zip(samples, legacy_outputs):
+            start = time.perf_counter()
+            output = apply_denoise(noisy, settings)
+            seconds += time.perf_counter() - start
+            psnr.append(cv2.PSNR(reference, output))
+            psnr_legacy.append(cv2.PSNR(legacy_output, output))
+
+        megapixels = sum(reference.shape[0] * reference.shape[1] for reference, _ in samples) / 1e6
+        result = {
+            'algorithm': algorithm,
+            'settings': settings,
+            'ms_per_image': round(seconds / len(samples) * 1000, 2),
+            'megapixels_per_s': round(megapixels / seconds, 2),
+            'psnr_db': round(float(np.mean(psnr)), 2),
+            'psnr_noisy_db': round(float(np.mean([cv2.PSNR(reference, noisy) for reference, noisy in samples])), 2),
+            'psnr_vs_legacy_db': round(float(np.mean(psnr_legacy)), 2)
+        }
+        results.append(result)
+        print_log(result, title=f'Denoise {algorithm}', level=1)
+
+    return results
+
+def make_batch(items, size):
+    return [items[index % len(items)] for index in range(size)]
+
+def reset_peak_rss():
+    # Linux: escrever 5 em clear_refs zera o VmHWM, então cada ação mede o próprio pico
+    for pid in ['self'] + get_worker_pids():
+        try:
+            with open(f'/proc/{pid}/clear_refs', 'w') as clear_refs:
+                clear_refs.write('5')
+        except OSError:
+            pass
+
+def read_peak_rss_mb():
+    # Processos da pool continuam vivos, então RUSAGE_CHILDREN não serve: lê o VmHWM de cada um
+    peak_kb = 0
+    for pid in ['self'] + get_worker_pids():
+        try:
+            with open(f'/proc/{pid}/status') as status:
+                for line in status:
+                    if line.startswith('VmHWM:'):
+                        peak_kb = max(peak_kb, int(line.split()[1]))
+        except OSError:
+            pass
+
+    if not peak_kb:
+        # Sem /proc (macOS): pico do processo principal desde o início
+        peak_kb = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        if sys.platform == 'darwin':
+            peak_kb //= 1024
+
+    return round(peak_kb / 1024, 1)
+
+def percentile(values, percent):
+    return round(float(np.percentile(values, percent)) * 1000, 2) if values else None
+
+def run_benchmark(action_names, workers_list, batch_sizes, repeat, corpus_path):
+    images_path, pdfs = generate_corpus(corpus_path)
+    # Cache desligado: queremos medir o trabalho, não o acerto de cache
+    cache.CACHE_ENABLED = False
+    session_id = new_session()
+    output_path = get_session_path(session_id) / 'benchmark_output'
+    output_path.mkdir(parents=True, exist_ok=True)
+    images_info, _ = import_images(session_id, [images_path])
+    images_info.sort(key=lambda image_info: str(image_info.get('relative_path')))
+    actions = get_actions(session_id, output_path, pdfs)
+    results = []
+
+    try:
+        for workers in workers_list:
+            shutdown_pool()
+            start_pool(workers)
+
+            for action_name in action_names:
+                action = actions[action_name]
+                items = pdfs if action_name == 'import_pdf' else images_info
+
+                reset_peak_rss()
+                # Latência por item: lotes de 1, amostra fixa e determinística do corpus
+                latencies = []
+                for item in items[:LATENCY_SAMPLES]:
+                    start = time.perf_counter()
+                    action([item])
+                    latencies.append(time.perf_counter() - start)
+                latency_peak_rss_mb = read_peak_rss_mb()
+
+                for batch_size in batch_sizes:
+                    # Pico medido por lote: sem zerar, cada linha somaria as latências e os lotes anteriores
+                    reset_peak_rss()
+                    batch = make_batch(items, batch_size)
+                    walls = []
+                    for _ in range(repeat):
+                        start = time.perf_counter()
+                        action(batch)
+                        walls.append(time.perf_counter() - start)
+
+                    wall = float(np.median(walls))
+                    result = {
+                        'action': action_name,
+                        'workers': workers,
+                        'batch': batch_size,
+                        'wall_s': round(wall, 4),
+                        'images_per_s': round(batch_size / wall, 2),
+                        'p50_ms': percentile(latencies, 50),
+                        'p95_ms': percentile(latencies, 95),
+                        'peak_rss_mb': read_peak_rss_mb(),
+                        'latency_peak_rss_mb': latency_peak_rss_mb
+                    }
+                    results.append(result)
+                    print_log(result, title=f'Benchmark {action_name}', level=1)
+    finally:
+        shutdown_pool()
+        shutil.rmtree(get_session_path(session_id), ignore_errors=True)
+
+    return results
+
+def get_commit():
+    try:
+        return subprocess.run(
+            ['git', 'rev-parse', 'HEAD'], cwd=Path(__file__).parent, capture_output=True, text=True, check=True
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+def compare_results(results, baseline_results, threshold):
+    # Regressão: throughput cai ou latência/memória sobe mais que o limite relativo
+    baseline = {(item['action'], item['workers'], item['batch']): item for item in baseline_results}
+    regressions = []
+
+    for item in results:
+        old = baseline.get((item['action'], item['workers'], item['batch']))
+        if old is None:
+            continue
+
+        checks = [
+            ('images_per_s', old['images_per_s'] * (1 - threshold), item['images_per_s'] < old['images_per_s'] * (1 - threshold)),
+            ('p95_ms', old['p95_ms'] * (1 + threshold), item['p95_ms'] > old['p95_ms'] * (1 + threshold)),
+            ('peak_rss_mb', old['peak_rss_mb'] * (1 + threshold), item['peak_rss_mb'] > old['peak_rss_mb'] * (1 + threshold))
+        ]
+        for metric, limit, regressed in checks:
+            if regressed:
+                regressions.append({
+                    'action': item['action'],
+                    'workers': item['workers'],
+                    'batch': item['batch'],
+                    'metric': metric,
+                    'baseline': old[metric],
+                    'current': item[metric],
+                    'limit': round(limit, 2)
+                })
+
+    return regressions
+
+if __name__ == "__main__":
+    args_string = " ".join(shlex.quote(arg) for arg in sys.argv[1:])
+    args_dict = parse_args(args_string)
+
+    def as_list(value, default):
+        if value is None:
+            return default
+        return value if isinstance(value, list) else [value]
+
+    action_names = as_list(args_dict.get('actions'), get_default_actions())
+    workers_list = as_list(args_dict.get('workers'), [1, 4])
+    batch_sizes = as_list(args_dict.get('batch'), [1, 8, 32])
+    repeat = args_dict.get('repeat', 3)
+    corpus_path = args_dict.get('corpus', BENCHMARK_FOLDER_PATH / 'corpus')
+    output = ensure_path(args_dict.get('output', BENCHMARK_FOLDER_PATH / 'results.json'))
+
+    results = run_benchmark(action_names, workers_list, batch_sizes, repeat, corpus_path)
+    report = {
+        'meta': {
+            'commit': get_commit(),
+            'date': datetime.now(timezone.utc).isoformat(),
+            'python': platform.python_version(),
+            'platform': platform.platform(),
+            'seed': CORPUS_SEED,
+            'repeat': repeat
+        },
+        'results': results
+    }
+    if args_dict.get('denoise_quality'):
+        report['denoise'] = run_denoise_quality(corpus_path)
+
+    output.parent.mkdir(parents=True, exist_ok=True)
+    output.write_text(json.dumps(report, indent=2))
+    print_log(output, title='Benchmark salvo', level=1)
+
+    if args_dict.get('compare'):
+        baseline_report = json.loads(ensure_path(args_dict.get('compare')).read_text())
+        regressions = compare_results(results, baseline_report.get('results', []), args_dict.get('threshold', 0.1))
+        if regressions:
+            print_log(regressions, title='Regressões', type='error', level=1)
+            sys.exit(1)
+        print_log('Sem regressões', title='Comparação', level=1)
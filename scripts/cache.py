@@ -0,0 +1,157 @@
+import hashlib
+import json
+import os
+import time
+from functools import lru_cache
+from debug_log import print_log
+from session import DATA_FOLDER_PATH, new_uuid
+
+# Fora de data/temp para sobreviver a clear_temp e a novas sessões
+CACHE_FOLDER_PATH = DATA_FOLDER_PATH / "cache"
+CACHE_VERSION = 1
+CACHE_ENABLED = True
+CACHE_MAX_BYTES = 2 * 1024 ** 3
+# Último uso de cada entrada (LRU). Fica num índice à parte: as entradas são hardlinks dos arquivos
+# da sessão, e mexer no mtime delas mexeria no dos arquivos da sessão também
+CACHE_INDEX_NAME = "index.json"
+DIGEST_MEMO_SIZE = 4096  # hashes lembrados por processo (sessões longas no REPL)
+
+cache_stats = {'hits': 0, 'misses': 0, 'evicted': 0, 'evicted_bytes': 0}
+# Usos registrados nesta execução, ainda não gravados no índice (ver enforce_cache_budget)
+cache_used = {}
+
+def content_digest(path):
+    digest = hashlib.sha256()
+    with open(path, 'rb') as file:
+        for chunk in iter(lambda: file.read(1024 * 1024), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+@lru_cache(maxsize=DIGEST_MEMO_SIZE)
+def memo_digest(path, size, mtime_ns):
+    # Tamanho e mtime na chave: arquivo alterado gera outra entrada; as antigas saem pelo LRU
+    return content_digest(path)
+
+def file_digest(path):
+    stat = os.stat(path)
+    return memo_digest(str(path), stat.st_size, stat.st_mtime_ns)
+
+def cache_key(source_path, operation, params):
+    normalized_params = json.dumps(params, sort_keys=True, default=str)
+    key = f'{CACHE_VERSION}|{file_digest(source_path)}|{operation}|{normalized_params}'
+    return hashlib.sha256(key.encode()).hexdigest()
+
+def get_cache_entry_folder(key):
+    return CACHE_FOLDER_PATH / key[:2]
+
+def get_cached_path(key):
+    folder = get_cache_entry_folder(key)
+    if not folder.is_dir():
+        return None
+
+    for path in folder.glob(f'{key}.*'):
+        return path
+
+    return None
+
+def store_cached(key, path):
+    folder = get_cache_entry_folder(key)
+    os.makedirs(folder, exist_ok=True)
+    cached_path = folder / f'{key}{path.suffix}'
+    tmp_path = folder / f'.{new_uuid()}.tmp'
+
+    try:
+        os.link(path, tmp_path)
+    except OSError:
+        with open(path, 'rb') as src, open(tmp_path, 'wb') as dst:
+            for chunk in iter(lambda: src.read(1024 * 1024), b''):
+                dst.write(chunk)
+
+    # Escrita atômica: dois workers com a mesma chave não corrompem a entrada
+    os.replace(tmp_path, cached_path)
+    return cached_path
+
+def record_cache_result(image_info):
+    # Roda no processo principal: os workers só devolvem a chave usada
+    key = image_info.pop('cache_key', None)
+    match image_info.pop('cache', None):
+        case 'hit':
+            cache_stats['hits'] += 1
+        case 'miss':
+            cache_stats['misses'] += 1
+    if key is not None:
+        cache_used[key] = time.time_ns()
+
+def get_cache_files():
+    # Só as entradas (e temporários órfãos) nas subpastas; o índice fica na raiz
+    if not CACHE_FOLDER_PATH.is_dir():
+        return []
+    return [path for path in CACHE_FOLDER_PATH.glob('*/*') if path.is_file()]
+
+def load_cache_index():
+    try:
+        with open(CACHE_FOLDER_PATH / CACHE_INDEX_NAME) as file:
+            return json.load(file).get('used', {})
+    except (OSError, ValueError):
+        return {}
+
+def save_cache_index(used):
+    os.makedirs(CACHE_FOLDER_PATH, exist_ok=True)
+    tmp_path = CACHE_FOLDER_PATH / f'.{new_uuid()}.tmp'
+    with open(tmp_path, 'w') as file:
+        json.dump({'version': CACHE_VERSION, 'used': used}, file)
+    os.replace(tmp_path, CACHE_FOLDER_PATH / CACHE_INDEX_NAME)
+
+def enforce_cache_budget(max_bytes = None):
+    max_bytes = CACHE_MAX_BYTES if max_bytes is None else max_bytes
+    if not CACHE_FOLDER_PATH.is_dir():
+        return 0
+
+    # Outra execução pode ter gravado o índice nesse meio tempo: fica o uso mais recente de cada chave
+    used = load_cache_index()
+    for key, used_ns in cache_used.items():
+        used[key] = max(used_ns, used.get(key, 0))
+    cache_used.clear()
+
+    entries = []
+    total_bytes = 0
+    for path in get_cache_files():
+        stat = path.stat()
+        key = path.name.split('.')[0]
+        # Sem registro de uso (ex.: temporário órfão): vale a data de gravação
+        entries.append((used.get(key, stat.st_mtime_ns), stat.st_size, path, key))
+        total_bytes += stat.st_size
+
+    # Chaves sem arquivo (removidas por outra execução ou por clear_cache) saem do índice
+    present = {key for _, _, _, key in entries}
+    evicted_bytes = 0
+    for _, size, path, key in sorted(entries):
+        if total_bytes <= max_bytes:
+            break
+        path.unlink(missing_ok=True)
+        present.discard(key)
+        total_bytes -= size
+        evicted_bytes += size
+        cache_stats['evicted'] += 1
+
+    save_cache_index({key: used_ns for key, used_ns in used.items() if key in present})
+
+    cache_stats['evicted_bytes'] += evicted_bytes
+    return evicted_bytes
+
+def get_cache_stats():
+    total_bytes = 0
+    entries = 0
+    for path in get_cache_files():
+        total_bytes += path.stat().st_size
+        entries += 1
+
+    return cache_stats | {'entries': entries, 'bytes': total_bytes, 'max_bytes': CACHE_MAX_BYTES}
+
+def clear_cache():
+    if CACHE_FOLDER_PATH.is_dir():
+        for path in CACHE_FOLDER_PATH.rglob('*'):
+            if path.is_file():
+                path.unlink()
+        cache_used.clear()
+        print_log("Deleted cache entries", title="CLEAR CACHE")
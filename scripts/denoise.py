@@ -0,0 +1,148 @@
+import math
+import cv2
+import numpy as np
+
+# Remoção de ruído da ação remove_noise: --algorithm, --radius, --strength, --scale, --sharpen.
+# Os filtros recebem e devolvem um array uint8 contíguo cinza (2D) ou de cor (3 canais, RGB ou BGR);
+# com alfa (4 canais), só a cor é filtrada.
+# radius em pixels; strength na escala 0-255 (sigma de cor do bilateral, raiz de eps do guiado, h do NL-means)
+
+DENOISE_ALGORITHMS = ['bilateral', 'guided', 'downsample', 'nlmeans', 'legacy']
+DENOISE_DEFAULT_ALGORITHM = 'bilateral'
+DENOISE_DEFAULTS = {
+    'bilateral': {'radius': 3, 'strength': 40, 'sharpen': 0},
+    'guided': {'radius': 2, 'strength': 30, 'sharpen': 0},
+    'downsample': {'radius': 2, 'strength': 50, 'scale': 0.5, 'sharpen': 0},
+    'nlmeans': {'radius': 5, 'strength': 10, 'sharpen': 0},
+    # Filtros fixos de antes (gaussiano 5x5 + bilateral d=22 + nitidez), para comparar saídas antigas
+    'legacy': {}
+}
+NLMEANS_TEMPLATE_SIZE = 7
+
+def get_denoise_settings(algorithm = None, radius = None, strength = None, scale = None, sharpen = None):
+    # Resolve os padrões do algoritmo: o resultado vai inteiro para a chave do cache
+    algorithm = algorithm or DENOISE_DEFAULT_ALGORITHM
+    if algorithm not in DENOISE_ALGORITHMS:
+        raise ValueError(f"Algoritmo de remoção de ruído inválido '{algorithm}' (use {', '.join(DENOISE_ALGORITHMS)})")
+
+    settings = {'algorithm': algorithm} | DENOISE_DEFAULTS[algorithm]
+    if algorithm == 'legacy':
+        return settings
+
+    if radius is not None:
+        settings['radius'] = radius
+    if strength is not None:
+        settings['strength'] = strength
+    if scale is not None and algorithm == 'downsample':
+        settings['scale'] = scale
+    if sharpen is not None:
+        # --sharpen sozinho = nitidez antiga (1); --sharpen 0 desliga
+        settings['sharpen'] = float(sharpen)
+
+    if not isinstance(settings['radius'], int) or settings['radius'] < 1:
+        raise ValueError(f"radius deve ser um inteiro >= 1: {settings['radius']}")
+    if not isinstance(settings['strength'], (int, float)) or settings['strength'] <= 0:
+        raise ValueError(f"strength deve ser > 0: {settings['strength']}")
+    if algorithm == 'downsample' and not 0 < settings['scale'] < 1:
+        raise ValueError(f"scale deve estar entre 0 e 1: {settings['scale']}")
+    if settings['sharpen'] < 0:
+        raise ValueError(f"sharpen deve ser >= 0: {settings['sharpen']}")
+
+    return settings
+
+def get_denoise_halo(settings):
+    # Raio total dos kernels aplicados: margem de cada faixa no motor em faixas
+    radius = settings.get('radius', 0)
+    match settings.get('algorithm'):
+        case 'legacy':
+            # gaussiano 2 + bilateral 11 + nitidez 1, com folga
+            return 16
+        case 'bilateral':
+            halo = radius
+        case 'guided':
+            # Duas passadas de caixa (médias e depois coeficientes)
+            halo = 2 * radius
+        case 'downsample':
+            halo = math.ceil((radius + 2) / settings.get('scale'))
+        case 'nlmeans':
+            halo = radius + NLMEANS_TEMPLATE_SIZE // 2
+    return halo + 2
+
+def sharpen_img(img, amount):
+    # amount 1 = kernel antigo [[-1,-1,-1],[-1,9,-1],[-1,-1,-1]] (imagem + 9 * detalhe da média 3x3)
+    if not amount:
+        return img
+    kernel = np.full((3, 3), -amount, np.float32)
+    kernel[1, 1] = 1 + 8 * amount
+    return cv2.filter2D(img, -1, kernel)
+
+def legacy_filter(img):
+    img = cv2.GaussianBlur(img, (5, 5), 1.5, 1.5)
+    img = cv2.bilateralFilter(img, 22, 75, 75)
+    return sharpen_img(img, 1)
+
+def bilateral_filter(img, radius, strength):
+    return cv2.bilateralFilter(img, 2 * radius + 1, strength, radius)
+
+def guided_filter(img, radius, strength):
+    # Filtro guiado (He et al.) com a própria imagem como guia, canal a canal, só com boxFilter:
+    # O(1) por pixel em qualquer raio e não depende do opencv-contrib (ximgproc)
+    # Um canal por vez em float32: o pico de memória fica em poucas cópias de um canal, não da imagem toda
+    eps = (strength / 255) ** 2
+    size = (2 * radius + 1, 2 * radius + 1)
+    planes = img[..., None] if img.ndim == 2 else img
+    output = np.empty_like(planes)
+
+    for channel in range(planes.shape[2]):
+        source = planes[..., channel].astype(np.float32)
+        source /= 255
+        mean = cv2.boxFilter(source, -1, size)
+        variance = cv2.boxFilter(source * source, -1, size)
+        variance -= mean * mean
+        a = variance / (variance + eps)
+        mean -= a * mean
+        filtered = cv2.boxFilter(a, -1, size)
+        filtered *= source
+        filtered += cv2.boxFilter(mean, -1, size)
+        filtered *= 255
+        filtered += 0.5
+        output[..., channel] = np.clip(filtered, 0, 255)
+
+    return output.reshape(img.shape)
+
+def downsample_filter(img, radius, strength, scale):
+    # Filtra numa cópia reduzida (a média por área já tira o grão) e volta ao tamanho original
+    height, width = img.shape[:2]
+    small = cv2.resize(img, (max(1, round(width * scale)), max(1, round(height * scale))), interpolation=cv2.INTER_AREA)
+    small = bilateral_filter(small, radius, strength)
+    return cv2.resize(small, (width, height), interpolation=cv2.INTER_CUBIC)
+
+def nlmeans_filter(img, radius, strength, order):
+    if img.ndim == 2:
+        return cv2.fastNlMeansDenoising(img, None, strength, NLMEANS_TEMPLATE_SIZE, 2 * radius + 1)
+    # Converte para Lab internamente assumindo BGR
+    bgr = img if order == 'BGR' else np.ascontiguousarray(img[..., ::-1])
+    bgr = cv2.fastNlMeansDenoisingColored(bgr, None, strength, strength, NLMEANS_TEMPLATE_SIZE, 2 * radius + 1)
+    return bgr if order == 'BGR' else np.ascontiguousarray(bgr[..., ::-1])
+
+def apply_denoise(img, settings, order = 'RGB'):
+    if img.ndim == 3 and img.shape[2] == 4:
+        output = np.empty_like(img)
+        output[..., :3] = filter_img(np.ascontiguousarray(img[..., :3]), settings, order)
+        output[..., 3] = img[..., 3]
+        return output
+    return filter_img(img, settings, order)
+
+def filter_img(img, settings, order):
+    match settings.get('algorithm'):
+        case 'legacy':
+            return legacy_filter(img)
+        case 'bilateral':
+            img = bilateral_filter(img, settings.get('radius'), settings.get('strength'))
+        case 'guided':
+            img = guided_filter(img, settings.get('radius'), settings.get('strength'))
+        case 'downsample':
+            img = downsample_filter(img, settings.get('radius'), settings.get('strength'), settings.get('scale'))
+        case 'nlmeans':
+            img = nlmeans_filter(img, settings.get('radius'), settings.get('strength'), order)
+    return sharpen_img(img, settings.get('sharpen'))
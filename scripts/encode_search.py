@@ -0,0 +1,208 @@
+import io
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+import cv2
+import numpy as np
+from PIL import Image
+
+# Busca de qualidade por imagem para to_jpeg e to_avif (--target_kb, --target_ssim).
+# Cada tentativa codifica só em memória; só o vencedor é gravado.
+# Com os dois alvos vale a menor qualidade que atinge o SSIM, desde que caiba no tamanho:
+# se não couber, o tamanho manda e o relatório marca o alvo de SSIM como não atingido.
+
+QUALITY_RANGE = (5, 95)
+SEARCH_MAX_ROUNDS = 7  # bisseção em 5..95 fecha em 7 rodadas
+SEARCH_MAX_PROBES = 4  # qualidades testadas em paralelo por rodada (limitado às threads da tarefa)
+SIZE_TOLERANCE = 0.05  # até 5% abaixo do alvo de tamanho já encerra a busca
+SSIM_TOLERANCE = 0.002  # até 0.002 acima do alvo de SSIM já encerra a busca
+SSIM_BAND_ROWS = 512  # SSIM em faixas: sem vários planos float32 da imagem inteira
+SSIM_HALO = 5  # raio da janela gaussiana 11x11
+
+def get_search_target(target_kb = None, target_ssim = None):
+    # None = sem busca (qualidade fixa de --quality)
+    if target_kb is None and target_ssim is None:
+        return None
+    if target_kb is not None and (not isinstance(target_kb, (int, float)) or target_kb <= 0):
+        raise ValueError(f'target_kb deve ser > 0: {target_kb}')
+    if target_ssim is not None and (not isinstance(target_ssim, (int, float)) or not 0 < target_ssim < 1):
+        raise ValueError(f'target_ssim deve estar entre 0 e 1: {target_ssim}')
+    return {'target_kb': target_kb, 'target_ssim': target_ssim}
+
+def get_luma(img):
+    return np.asarray(img.convert('L'), dtype=np.float32)
+
+def ssim_map(reference, candidate):
+    # SSIM de Wang et al. (2004), janela gaussiana 11x11 com sigma 1.5
+    c1 = (0.01 * 255) ** 2
+    c2 = (0.03 * 255) ** 2
+    blur = lambda plane: cv2.GaussianBlur(plane, (11, 11), 1.5)
+    mean_x = blur(reference)
+    mean_y = blur(candidate)
+    mean_xx = mean_x * mean_x
+    mean_yy = mean_y * mean_y
+    mean_xy = mean_x * mean_y
+    variance_x = blur(reference * reference) - mean_xx
+    variance_y = blur(candidate * candidate) - mean_yy
+    covariance = blur(reference * candidate) - mean_xy
+    return ((2 * mean_xy + c1) * (2 * covariance + c2)) / ((mean_xx + mean_yy + c1) * (variance_x + variance_y + c2))
+
+def ssim(reference, candidate):
+    # Média do mapa por faixas com margem: mesmo valor do cálculo na imagem inteira
+    height = reference.shape[0]
+    total = 0.0
+    for top in range(0, height, SSIM_BAND_ROWS):
+        start = max(0, top - SSIM_HALO)
+        end = min(height, top + SSIM_BAND_ROWS + SSIM_HALO)
+        band = ssim_map(reference[start:end], candidate[start:end])
+        total += float(band[top - start:top - start + min(SSIM_BAND_ROWS, height - top)].sum())
+    return total / reference.size
+
+def encode_trial(img, save_args, reference, quality):
+    buffer = io.BytesIO()
+    img.save(buffer, **save_args, quality=quality)
+    trial = {'quality': quality, 'data': buffer.getbuffer(), 'ssim': None}
+    if reference is not None:
+        with Image.open(io.BytesIO(trial['data'])) as candidate:
+            trial['ssim'] = ssim(reference, get_luma(candidate))
+    return trial
+
+def get_probes(lo, hi, probes):
+    # Qualidades igualmente espaçadas dentro de [lo, hi]; com uma só, o meio (bisseção)
+    return sorted({lo + (hi - lo) * (index + 1) // (probes + 1) for index in range(probes)})
+
+def bisect_quality(run, passes, close, lo, hi, highest):
+    # Fronteira de um critério monótono na qualidade: a maior (highest) ou a menor qualidade em
+    # [lo, hi] que passa. Para antes se alguma tentativa aprovada estiver perto do alvo (close)
+    best = None
+    for _ in range(SEARCH_MAX_ROUNDS):
+        if lo > hi:
+            break
+        qualities = get_probes(lo, hi, run.probes)
+        trials = run(qualities)
+        passing = [quality for quality, trial in zip(qualities, trials) if passes(trial)]
+        failing = [quality for quality in qualities if quality not in passing]
+        near = [quality for quality, trial in zip(qualities, trials) if quality in passing and close(trial)]
+        if near:
+            return max(near) if highest else min(near)
+        if highest:
+            if passing:
+                best = max(passing)
+                lo = best + 1
+            if failing:
+                hi = min(failing) - 1
+        else:
+            if passing:
+                best = min(passing)
+                hi = best - 1
+            if failing:
+                lo = max(failing) + 1
+    return best
+
+class TrialRunner:
+    # Codifica as qualidades pedidas (em paralelo quando há mais de uma thread) e guarda cada
+    # tentativa: a segunda busca e a gravação final reaproveitam o que já foi codificado
+    def __init__(self, img, save_args, reference, probes):
+        self.img = img
+        self.save_args = save_args
+        self.reference = reference
+        self.probes = probes
+        self.trials = {}
+        self.executor = ThreadPoolExecutor(max_workers=probes) if probes > 1 else None
+        self.local = threading.local()
+
+    def get_image(self):
+        # Image.save guarda os parâmetros no próprio objeto: cada thread codifica a sua cópia
+        if self.executor is None:
+            return self.img
+        if not hasattr(self.local, 'img'):
+            self.local.img = self.img.copy()
+        return self.local.img
+
+    def encode(self, quality):
+        return encode_trial(self.get_image(), self.save_args, self.reference, quality)
+
+    def __call__(self, qualities):
+        missing = [quality for quality in qualities if quality not in self.trials]
+        results = self.executor.map(self.encode, missing) if self.executor is not None else map(self.encode, missing)
+        for trial in results:
+            self.trials[trial.get('quality')] = trial
+        return [self.trials[quality] for quality in qualities]
+
+    def close(self):
+        if self.executor is not None:
+            self.executor.shutdown()
+
+def search_quality(img, save_args, target_kb = None, target_ssim = None, threads = 1):
+    # Devolve (bytes codificados do vencedor, resultado para o relatório)
+    probes = max(1, min(threads, SEARCH_MAX_PROBES))
+    if save_args.get('format') == 'AVIF':
+        # Tentativas em paralelo dividem as threads do codificador
+        save_args = save_args | {'max_threads': max(1, threads // probes)}
+    img.load()
+    reference = get_luma(img) if target_ssim is not None else None
+    run = TrialRunner(img, save_args, reference, probes)
+    lo, hi = QUALITY_RANGE
+    limit = target_kb * 1024 if target_kb is not None else None
+
+    try:
+        quality = hi
+        if target_ssim is not None:
+            best = bisect_quality(
+                run,
+                lambda trial: trial.get('ssim') >= target_ssim,
+                lambda trial: trial.get('ssim') - target_ssim <= SSIM_TOLERANCE,
+                lo, hi, highest=False
+            )
+            quality = best if best is not None else hi
+        if limit is not None and run([quality])[0].get('data').nbytes > limit:
+            best = bisect_quality(
+                run,
+                lambda trial: trial.get('data').nbytes <= limit,
+                lambda trial: trial.get('data').nbytes >= limit * (1 - SIZE_TOLERANCE),
+                lo, quality - 1, highest=True
+            )
+            quality = best if best is not None else lo
+        winner = run([quality])[0]
+    finally:
+        run.close()
+
+    if winner.get('ssim') is None:
+        # Só para o relatório: SSIM do vencedor mesmo quando o alvo é só tamanho
+        with Image.open(io.BytesIO(winner.get('data'))) as candidate:
+            winner['ssim'] = ssim(get_luma(img), get_luma(candidate))
+
+    size = winner.get('data').nbytes
+    result = {
+        'quality': quality,
+        'kb': round(size / 1024, 1),
+        'ssim': round(winner.get('ssim'), 4),
+        'trials': len(run.trials),
+        'target_met': (limit is None or size <= limit) and (target_ssim is None or winner.get('ssim') >= target_ssim)
+    }
+    return winner.get('data'), result
+
+def get_search_report(images_info):
+    # Tamanho e qualidade atingidos por imagem. Sem resultado da busca = veio do cache (a busca não
+    # foi refeita): só o tamanho do arquivo
+    rows = []
+    for image_info in images_info:
+        row = {'image': str(image_info.get('relative_path'))}
+        result = image_info.get('encode_search')
+        if result is not None:
+            row |= result
+        else:
+            row['kb'] = round(os.path.getsize(image_info.get('path')) / 1024, 1)
+            row['from_cache'] = True
+        rows.append(row)
+
+    searched = [row for row in rows if 'target_met' in row]
+    summary = {
+        'images': len(rows),
+        'target_met': sum(1 for row in searched if row.get('target_met')),
+        'target_missed': sum(1 for row in searched if not row.get('target_met')),
+        'from_cache': len(rows) - len(searched),
+        'total_kb': round(sum(row.get('kb') for row in rows), 1),
+        'trials': sum(row.get('trials', 0) for row in rows)
+    }
+    return rows, summary
@@ -0,0 +1,104 @@
+import cv2
+import numpy as np
+from PIL import Image
+
+# Imagem como array NumPy compartilhado entre operações OpenCV e Pillow, sem ida e volta por PIL.Image.
+# order é a ordem dos canais de cor ('BGR' do OpenCV, 'RGB' do Pillow); cinza (2D) e o canal alfa
+# não dependem dela. Quem produz em BGR codifica com cv2.imencode sem conversão nenhuma.
+
+CV2_ENCODE_EXTENSIONS = {'PNG': '.png', 'JPEG': '.jpg', 'WEBP': '.webp', 'TIFF': '.tiff', 'BMP': '.bmp', 'PPM': '.ppm'}
+EXIF_ORIENTATION_TAG = 0x0112
+# Orientação EXIF -> operações do OpenCV que deixam a imagem em pé (mesmo resultado do ImageOps.exif_transpose)
+EXIF_ORIENTATION_OPS = {
+    2: lambda array: cv2.flip(array, 1),
+    3: lambda array: cv2.rotate(array, cv2.ROTATE_180),
+    4: lambda array: cv2.flip(array, 0),
+    5: lambda array: cv2.transpose(array),
+    6: lambda array: cv2.rotate(array, cv2.ROTATE_90_CLOCKWISE),
+    7: lambda array: cv2.flip(cv2.transpose(array), -1),
+    8: lambda array: cv2.rotate(array, cv2.ROTATE_90_COUNTERCLOCKWISE)
+}
+
+class ImageBuffer:
+    def __init__(self, array, order = 'BGR'):
+        self.array = array
+        self.order = order
+
+    @property
+    def channels(self):
+        return 1 if self.array.ndim == 2 else self.array.shape[2]
+
+    @property
+    def size(self):
+        return self.array.shape[1], self.array.shape[0]
+
+    def as_order(self, order):
+        # Única conversão possível entre os dois lados: troca de canais de cor quando as ordens diferem
+        if self.order == order or self.channels == 1:
+            return self.array
+        code = {
+            (3, 'RGB'): cv2.COLOR_BGR2RGB,
+            (3, 'BGR'): cv2.COLOR_RGB2BGR,
+            (4, 'RGB'): cv2.COLOR_BGRA2RGBA,
+            (4, 'BGR'): cv2.COLOR_RGBA2BGRA
+        }[(self.channels, order)]
+        return cv2.cvtColor(self.array, code)
+
+    def to_pil(self):
+        # L e RGBA: o Pillow usa a mesma memória do array (só RGB vira RGBX internamente, com cópia)
+        return Image.fromarray(self.as_order('RGB'))
+
+    @classmethod
+    def from_pil(cls, img):
+        if img.mode not in ('L', 'RGB', 'RGBA'):
+            img = img.convert('RGBA' if 'A' in img.mode or 'transparency' in img.info else 'RGB')
+        return cls(np.asarray(img), 'RGB')
+
+def get_exif_orientation(path):
+    # Só o cabeçalho: Image.open não decodifica os pixels
+    try:
+        with Image.open(path) as img:
+            return img.getexif().get(EXIF_ORIENTATION_TAG, 1)
+    except (OSError, SyntaxError, ValueError):
+        return 1
+
+def read_buffer(path):
+    # IMREAD_UNCHANGED mantém alfa e cinza, mas ignora a orientação EXIF: aplicada aqui
+    array = cv2.imread(str(path), cv2.IMREAD_UNCHANGED)
+    if array is None:
+        return None
+
+    if array.dtype == np.uint16:
+        # PNG/TIFF de 16 bits: o resto do programa trabalha em 8 bits (mesmo corte do IMREAD_COLOR)
+        array = (array >> 8).astype(np.uint8)
+    elif array.dtype != np.uint8:
+        raise ValueError(f'Profundidade de cor não suportada: {array.dtype}')
+    if array.ndim == 3 and array.shape[2] == 1:
+        array = array[..., 0]
+
+    orientation_op = EXIF_ORIENTATION_OPS.get(get_exif_orientation(path))
+    if orientation_op is not None:
+        array = orientation_op(array)
+
+    return ImageBuffer(array, 'BGR')
+
+def encode_buffer(buffer, format, quality = None, optimize = True):
+    # None = formato sem codificador no OpenCV (ex.: AVIF): quem chama usa o Pillow.
+    # Padrões iguais aos do Pillow em save_new_image (JPEG 75, WEBP 80, PNG nível 9 com optimize)
+    extension = CV2_ENCODE_EXTENSIONS.get(format)
+    if extension is None:
+        return None
+
+    params = []
+    match format:
+        case 'PNG':
+            params = [cv2.IMWRITE_PNG_COMPRESSION, 9 if optimize else 6]
+        case 'JPEG':
+            params = [cv2.IMWRITE_JPEG_QUALITY, quality or 75, cv2.IMWRITE_JPEG_OPTIMIZE, int(optimize)]
+        case 'WEBP':
+            params = [cv2.IMWRITE_WEBP_QUALITY, quality or 80]
+
+    success, encoded = cv2.imencode(extension, buffer.as_order('BGR'), params)
+    if not success:
+        raise OSError(f'Falha ao codificar {format} com OpenCV')
+    return encoded
@@ -0,0 +1,139 @@
+from pathlib import Path
+
+# Registro de imagem com __slots__: mesma interface de dicionário que o resto do código já usa
+# (get, [], in, items, pop, copy), mas sem __dict__ por imagem e com cópia rasa barata.
+# Chaves fora dos campos fixos (cache, pages, external_output_path...) ficam em extra.
+# Registros derivados compartilham valores com o original: troque valores, não os altere no lugar.
+
+RECORD_FIELDS = ('external_source_path', 'relative_path', 'id', 'session_id', 'path', 'old_id', 'status', 'error')
+# Caminhos podem chegar como texto (ex.: manifesto) e só viram Path no primeiro acesso
+PATH_FIELDS = frozenset(('external_source_path', 'relative_path', 'path'))
+FIELD_NAMES = frozenset(RECORD_FIELDS)
+
+class Missing:
+    __slots__ = ()
+
+    def __reduce__(self):
+        return 'MISSING'
+
+    def __repr__(self):
+        return 'MISSING'
+
+MISSING = Missing()
+
+class ImageRecord:
+    __slots__ = RECORD_FIELDS + ('extra',)
+
+    def __init__(self, fields = None, **kwargs):
+        for name in RECORD_FIELDS:
+            setattr(self, name, MISSING)
+        self.extra = None
+        for key, value in (fields or {}).items():
+            self[key] = value
+        for key, value in kwargs.items():
+            self[key] = value
+
+    def raw(self, key, default = None):
+        # Valor como está guardado (caminho ainda em texto, se veio assim)
+        if key in FIELD_NAMES:
+            value = getattr(self, key)
+            return default if value is MISSING else value
+        return self.extra.get(key, default) if self.extra else default
+
+    def get(self, key, default = None):
+        if key in FIELD_NAMES:
+            value = getattr(self, key)
+            if value is MISSING:
+                return default
+            if key in PATH_FIELDS and isinstance(value, str):
+                value = Path(value)
+                setattr(self, key, value)
+            return value
+        return self.extra.get(key, default) if self.extra else default
+
+    def __getitem__(self, key):
+        value = self.get(key, MISSING)
+        if value is MISSING:
+            raise KeyError(key)
+        return value
+
+    def __setitem__(self, key, value):
+        if key in FIELD_NAMES:
+            setattr(self, key, value)
+        elif self.extra is None:
+            self.extra = {key: value}
+        else:
+            self.extra[key] = value
+
+    def __delitem__(self, key):
+        if key not in self:
+            raise KeyError(key)
+        self.pop(key)
+
+    def pop(self, key, default = None):
+        value = self.get(key, MISSING)
+        if value is MISSING:
+            return default
+        if key in FIELD_NAMES:
+            setattr(self, key, MISSING)
+        else:
+            del self.extra[key]
+        return value
+
+    def setdefault(self, key, default = None):
+        value = self.get(key, MISSING)
+        if value is MISSING:
+            self[key] = default
+            return default
+        return value
+
+    def __contains__(self, key):
+        if key in FIELD_NAMES:
+            return getattr(self, key) is not MISSING
+        return bool(self.extra) and key in self.extra
+
+    def keys(self):
+        keys = [name for name in RECORD_FIELDS if getattr(self, name) is not MISSING]
+        return keys + list(self.extra) if self.extra else keys
+
+    def __iter__(self):
+        return iter(self.keys())
+
+    def __len__(self):
+        return len(self.keys())
+
+    def items(self):
+        return [(key, self.get(key)) for key in self.keys()]
+
+    def values(self):
+        return [self.get(key) for key in self.keys()]
+
+    def copy(self):
+        # Cópia rasa: substitui o copy.deepcopy por imagem (só extra ganha dicionário próprio)
+        record = ImageRecord.__new__(ImageRecord)
+        for name in RECORD_FIELDS:
+            setattr(record, name, getattr(self, name))
+        record.extra = dict(self.extra) if self.extra else None
+        return record
+
+    def __getstate__(self):
+        # Tupla posicional: o pickle para os workers não repete os nomes dos campos
+        return tuple(getattr(self, name) for name in RECORD_FIELDS) + (self.extra,)
+
+    def __setstate__(self, state):
+        for name, value in zip(RECORD_FIELDS, state):
+            setattr(self, name, value)
+        self.extra = state[-1]
+
+    def __eq__(self, other):
+        if isinstance(other, (ImageRecord, dict)):
+            return dict(self.items()) == dict(other.items())
+        return NotImplemented
+
+    __hash__ = None
+
+    def __repr__(self):
+        return repr(dict(self.items()))
+
+def as_record(image_info):
+    return image_info if isinstance(image_info, ImageRecord) else ImageRecord(image_info)
@@ -1,15 +1,30 @@
-import copy
+import hashlib
 import subprocess
 import cv2
 import fitz
 import io
+import json
 import pillow_avif
 import math
-from multiprocessing import Pool, cpu_count
+import os
+import zlib
+import cache
+from collections import deque
+from functools import partial
 from debug_log import print_log
-from session import get_session_images_path, new_uuid, copy_file, ensure_path
+from denoise import apply_denoise, get_denoise_halo, get_denoise_settings
+from encode_search import get_search_target, search_quality
+from image_buffer import ImageBuffer, encode_buffer, read_buffer
+from image_record import ImageRecord, as_record
+from metrics import stage
+from workers import get_pool_size, get_task_threads, imap_bounded, map_scheduled, map_traced
+from pdf_writer import PdfStreamWriter, draw_image_op, pdf_number
+from tiles import load_scratch, should_tile, tiled_crop, tiled_filter, tiled_flatten, tiled_resize, write_tiled
+from manifest import record_image, record_images
+from cache import cache_key, content_digest, enforce_cache_budget, file_digest, get_cached_path, record_cache_result, store_cached
+from session import IMPORT_MODES, get_session_images_path, link_file, new_uuid, ensure_path
 from concurrent.futures import ThreadPoolExecutor
-from PIL import Image, UnidentifiedImageError, ImageFile, ImageDraw
+from PIL import Image, UnidentifiedImageError, ImageFile, ImageDraw, ImageOps
 from docx import Document
 from docx.shared import Inches
 from docx.enum.text import WD_ALIGN_PARAGRAPH
@@ -21,13 +36,29 @@ import numpy as np
 Image.MAX_IMAGE_PIXELS = None  # sem limite
 ImageFile.LOAD_TRUNCATED_IMAGES = True
 
-def import_image(image_info):
+BG_STRIP_ROWS = 256  # linhas por faixa na remoção de fundo
+EXTRACT_WRITE_WINDOW = 16  # imagens extraídas de PDF aguardando escrita ao mesmo tempo
+GRID_DECODE_THREADS = 4  # cartas decodificadas em paralelo dentro de cada folha
+RESIZE_DRAFT_MARGIN = 2  # draft de JPEG mantém ao menos 2x o tamanho final
+RESIZE_REDUCING_GAP = 3.0  # reduce() inteiro até 3x o tamanho final, depois o filtro escolhido
+PDF_SHARD_MAX_PAGES = 16  # páginas por tarefa na rasterização de PDFs
+EXPORT_SIDECAR_NAME = '.rr_export.json'  # estado da última exportação para pular saídas inalteradas
+PDF_PAGE_EXTENSIONS = {'png': 'png', 'jpeg': 'jpg', 'avif': 'avif', 'raw': 'ppm'}
+
+def import_image(import_mode, image_info):
     src = image_info.get('external_source_path')
-    dst = image_info.get('path')
-    status, error = copy_file(src, dst)
+
+    if import_mode == 'reference':
+        # Sem cópia: o registro aponta para a origem (somente leitura) e a primeira ação lê dela
+        image_info['path'] = src
+        image_info['status'] = os.path.isfile(src)
+        image_info['error'] = '' if image_info['status'] else f'Arquivo não encontrado: {src}'
+        return image_info, 'reference'
+
+    status, error, used_mode = link_file(src, image_info.get('path'), import_mode)
     image_info['status'] = status
     image_info['error'] = error
-    return image_info
+    return image_info, used_mode
 
 def get_images_path_from_dirs(dir_images_path):
     results = []
@@ -50,7 +81,10 @@ def get_images_path_from_dirs(dir_images_path):
 
     return results
 
-def import_images(session_id, images_path):
+def import_images(session_id, images_path, import_mode = 'auto'):
+    if import_mode not in IMPORT_MODES:
+        raise ValueError(f'Modo de importação não suportado: {import_mode}')
+
     images_folder_path = get_session_images_path(session_id)
     import_images_info = []
     images_info = []
@@ -64,121 +98,346 @@ def import_images(session_id, images_path):
 
         image_id = new_uuid()
 
-        image_info = {
-            "external_source_path": image_path,
-            "relative_path": relative_path,  # 👈 NOVO
-            "id": image_id,
-            "session_id": session_id,
-            "path": images_folder_path / f"{image_id}--{image_path.name}"
-        }
+        image_info = ImageRecord(
+            external_source_path=image_path,
+            relative_path=relative_path,
+            id=image_id,
+            session_id=session_id,
+            path=images_folder_path / f"{image_id}--{image_path.name}"
+        )
 
         import_images_info.append(image_info)
     
+    used_modes = {}
     with ThreadPoolExecutor() as executor:
-        copy_results = list(executor.map(import_image, import_images_info))
-        for result_image_info in copy_results:
+        copy_results = list(executor.map(partial(import_image, import_mode), import_images_info))
+        for result_image_info, used_mode in copy_results:
+            used_modes[used_mode] = used_modes.get(used_mode, 0) + 1
             if result_image_info.get('status'):
                 images_info.append(result_image_info)
             else:
                 error_images_info.append(result_image_info)
+    print_log(used_modes, title=f'Importação ({import_mode})', level=2)
 
+    record_images(images_info + error_images_info)
     return images_info, error_images_info
 
-def import_images_from_pdf(session_id, pdfs_path, page_as_image = False, dpi = 300):
+def save_pixmap(pix, path, image_format, quality):
+    match(image_format):
+        case 'png':
+            pix.save(path)
+        case 'jpeg':
+            pix.save(path, output='jpg', jpg_quality=quality)
+        case 'raw':
+            pix.save(path, output='pnm')
+        case 'avif':
+            mode = "RGBA" if pix.alpha else "RGB"
+            img = Image.frombytes(mode, (pix.width, pix.height), pix.samples)
+            img.save(path, format="AVIF", quality=quality, max_threads=get_task_threads())
+        case _:
+            raise ValueError(f'Formato não suportado: {image_format}')
+
+def rasterize_pdf_pages(config):
+    session_id = config.get('session_id')
+    pdf_path = config.get('pdf_path')
+    start = config.get('start')
+    end = config.get('end')
+    dpi = config.get('dpi')
+    image_format = config.get('image_format')
+    quality = config.get('quality')
     images_folder_path = get_session_images_path(session_id)
     images_info = []
 
+    # Cada worker abre o próprio documento: objetos fitz não são compartilháveis entre processos
+    with fitz.open(pdf_path) as pdf_doc:
+        for page_index in range(start, end):
+            page_number = page_index + 1
+            image_id = new_uuid()
+            relative_path = ensure_path(f"{pdf_path.stem}_{page_number}.{PDF_PAGE_EXTENSIONS.get(image_format, image_format)}")
+            image_info = ImageRecord(
+                external_source_path=images_folder_path / relative_path,
+                relative_path=relative_path,
+                id=image_id,
+                session_id=session_id,
+                path=images_folder_path / f'{image_id}--{relative_path.name}'
+            )
+
+            try:
+                pix = pdf_doc[page_index].get_pixmap(dpi=dpi)
+                save_pixmap(pix, image_info.get('path'), image_format, quality)
+                image_info['status'] = True
+            except Exception as e:
+                image_info['status'] = False
+                image_info['error'] = f"Falha ao rasterizar página {page_number} de '{pdf_path}': {e}"
+
+            images_info.append(image_info)
+
+    return images_info
+
+def rasterize_pdfs(session_id, pdfs_path, dpi, image_format, quality):
+    images_info = []
+    error_images_info = []
+    configs = []
+    documents = []
+
     for pdf_path in pdfs_path:
         pdf_path = ensure_path(pdf_path)
-        pdf_doc = fitz.open(pdf_path)
+        with fitz.open(pdf_path) as pdf_doc:
+            documents.append((pdf_path, len(pdf_doc)))
 
-        for page_index in range(len(pdf_doc)):
-            page = pdf_doc[page_index]
-            page_number = page_index + 1
+    # Fatias de páginas de todos os PDFs entram juntas na pool, então vários PDFs rodam em paralelo
+    total_pages = sum(page_count for _, page_count in documents)
+    shard_size = max(1, min(PDF_SHARD_MAX_PAGES, math.ceil(total_pages / (get_pool_size() * 4))))
 
-            if page_as_image:
-                pix = page.get_pixmap(dpi=dpi)
-                image_id = new_uuid()
-                relative_path = ensure_path(f"{pdf_path.stem}_{page_number}.png")
-                image_info = {
-                'external_source_path': images_folder_path / relative_path,
-                'relative_path': relative_path,
-                'id': image_id,
+    for pdf_path, page_count in documents:
+        for start in range(0, page_count, shard_size):
+            configs.append({
                 'session_id': session_id,
-                'path': images_folder_path / f'{image_id}--{relative_path.name}'
-            }
-                pix.save(image_info.get('path'))
+                'pdf_path': pdf_path,
+                'start': start,
+                'end': min(start + shard_size, page_count),
+                'dpi': dpi,
+                'image_format': image_format,
+                'quality': quality
+            })
+
+    for shard_images_info in map_traced('rasterize_pdf_pages', rasterize_pdf_pages, configs, chunksize=1):
+        for image_info in shard_images_info:
+            if image_info.get('status'):
                 images_info.append(image_info)
             else:
-                images = page.get_images(full=True)
-
-                for image_index, image in enumerate(images):
-                    xref = image[0]
-                    base_image = pdf_doc.extract_image(xref)
-                    image_bytes = base_image['image']
-                    image_ext = base_image['ext']
-                    image_id = new_uuid()
-                    relative_path = ensure_path(f"{pdf_path.stem}_{page_number}.{image_ext}")
-                    image_info = {
-                        'external_source_path': images_folder_path / relative_path,
-                        'relative_path': relative_path,
-                        'id': image_id,
-                        'session_id': session_id,
-                        'path': images_folder_path / f'{image_id}--{relative_path.name}'
-                    }
-                    with open(image_info.get('path'), 'wb') as file:
-                        file.write(image_bytes)
-                    
-                    images_info.append(image_info)
-
-    return images_info, []
+                error_images_info.append(image_info)
+
+    return images_info, error_images_info
+
+def write_image_bytes(image_info, image_bytes):
+    # Hash e escrita juntos: depois disso os bytes da imagem podem ser liberados
+    digest = digest_bytes(image_bytes)
+    try:
+        with open(image_info.get('path'), 'wb') as file:
+            file.write(image_bytes)
+        image_info['status'] = True
+    except OSError as e:
+        image_info['status'] = False
+        image_info['error'] = f"Falha ao gravar '{image_info.get('path')}': {e}"
+    return image_info, digest
+
+def digest_bytes(image_bytes):
+    return hashlib.sha256(image_bytes).hexdigest()
+
+def extract_pdf_images(session_id, pdfs_path):
+    images_folder_path = get_session_images_path(session_id)
+    images_info = []
+    error_images_info = []
+    extracted = []
+    pending = deque()
+
+    with ThreadPoolExecutor() as executor:
+        for pdf_path in pdfs_path:
+            pdf_path = ensure_path(pdf_path)
+            images_by_xref = {}
+
+            # fitz não é thread-safe: leitura dos xrefs fica serial, hash e escrita vão para as threads
+            with fitz.open(pdf_path) as pdf_doc:
+                for page_index in range(len(pdf_doc)):
+                    page_number = page_index + 1
+
+                    for image_index, image in enumerate(pdf_doc[page_index].get_images(full=True), start=1):
+                        xref = image[0]
+
+                        if xref in images_by_xref:
+                            pages = images_by_xref[xref]['pages']
+                            if pages[-1] != page_number:
+                                pages.append(page_number)
+                            continue
+
+                        base_image = pdf_doc.extract_image(xref)
+                        image_bytes = base_image['image']
+                        # Nome estável: página do primeiro uso + posição da imagem na página
+                        relative_path = ensure_path(f"{pdf_path.stem}_{page_number}_{image_index}.{base_image['ext']}")
+                        image_id = new_uuid()
+                        image_info = ImageRecord(
+                            external_source_path=images_folder_path / relative_path,
+                            relative_path=relative_path,
+                            id=image_id,
+                            session_id=session_id,
+                            path=images_folder_path / f'{image_id}--{relative_path.name}',
+                            pages=[page_number]
+                        )
+                        images_by_xref[xref] = image_info
+                        # Cada imagem é gravada assim que extraída: só o hash fica para a deduplicação,
+                        # e no máximo EXTRACT_WRITE_WINDOW imagens ficam em memória esperando a escrita
+                        future = executor.submit(write_image_bytes, image_info, image_bytes)
+                        extracted.append((pdf_path, future))
+                        pending.append(future)
+                        if len(pending) > EXTRACT_WRITE_WINDOW:
+                            pending.popleft().result()
+
+    # xrefs diferentes com o mesmo conteúdo no mesmo PDF viram uma única imagem com as páginas somadas;
+    # as cópias gravadas depois da primeira são apagadas
+    unique_images = {}
+    for pdf_path, future in extracted:
+        image_info, digest = future.result()
+        digest = (pdf_path, digest)
+        if digest in unique_images:
+            pages = unique_images[digest]['pages']
+            pages.extend(page for page in image_info['pages'] if page not in pages)
+            pages.sort()
+            image_info.get('path').unlink(missing_ok=True)
+            continue
+        unique_images[digest] = image_info
+        if image_info.get('status'):
+            images_info.append(image_info)
+        else:
+            error_images_info.append(image_info)
+
+    return images_info, error_images_info
+
+def import_images_from_pdf(session_id, pdfs_path, page_as_image = False, dpi = 300, image_format = 'png', quality = 90):
+    if page_as_image:
+        images_info, error_images_info = rasterize_pdfs(session_id, pdfs_path, dpi, image_format, quality)
+    else:
+        images_info, error_images_info = extract_pdf_images(session_id, pdfs_path)
+
+    record_images(images_info + error_images_info)
+    return images_info, error_images_info
     
-def export_image(image_info):
+def load_export_sidecar(output_directory_path):
+    try:
+        with open(output_directory_path / EXPORT_SIDECAR_NAME) as file:
+            return json.load(file).get('files', {})
+    except (OSError, ValueError):
+        return {}
+
+def save_export_sidecar(output_directory_path, entries):
+    tmp_path = output_directory_path / f'.{new_uuid()}.tmp'
+    with open(tmp_path, 'w') as file:
+        json.dump({'version': 1, 'files': entries}, file)
+    os.replace(tmp_path, output_directory_path / EXPORT_SIDECAR_NAME)
+
+def export_image(export_mode, item):
+    image_info, entry = item
     src = image_info.get('path')
     dst = image_info.get('external_output_path')
-    status, error = copy_file(src, dst)
-    image_info['status'] = status
-    image_info['error'] = error
-    return image_info
 
-def export_images(images_info, output_directory_path, with_id = False, prefix = None, sufix = None):
-    success_images_info = []
-    error_images_info = []
+    try:
+        source_stat = os.stat(src)
+        source_digest = file_digest(src)
+
+        # Pula só se o destino ainda tem o conteúdo gravado no último export e a origem não mudou.
+        # Compara hashes, não mtime: o inode da sessão é compartilhado com o cache e com hardlinks
+        if entry is not None and entry.get('sha256') == source_digest and entry.get('size') == source_stat.st_size:
+            try:
+                untouched = os.path.getsize(dst) == entry.get('size') and content_digest(dst) == source_digest
+            except FileNotFoundError:
+                untouched = False
+
+            if untouched:
+                image_info['status'] = True
+                image_info['error'] = ''
+                return image_info, entry, 'skipped'
+
+        # Arquivo da sessão que divide o inode com o cache: hardlink no destino deixaria uma edição no
+        # lugar corromper a entrada do cache. Reflink (ou cópia) no lugar
+        link_mode = 'reflink' if export_mode == 'hardlink' and source_stat.st_nlink > 1 else export_mode
+        # Grava ao lado e troca com os.replace: nunca escreve através de um hardlink antigo no destino
+        tmp_path = dst.with_name(f'.{new_uuid()}.tmp')
+        status, error, used_mode = link_file(src, tmp_path, link_mode)
+        if not status:
+            tmp_path.unlink(missing_ok=True)
+            image_info['status'] = False
+            image_info['error'] = error
+            return image_info, None, 'error'
+        os.replace(tmp_path, dst)
+
+        entry = {'size': source_stat.st_size, 'sha256': source_digest}
+        image_info['status'] = True
+        image_info['error'] = ''
+        return image_info, entry, used_mode
+
+    except OSError as e:
+        image_info['status'] = False
+        image_info['error'] = f"Falha ao exportar '{src}': {e}"
+        return image_info, None, 'error'
+
+def start_export(output_directory_path, with_id = False, prefix = None, sufix = None, export_mode = 'auto'):
+    # Exportação incremental: as imagens entram à medida que ficam prontas (ex.: direto do pipeline)
     output_directory_path = ensure_path(output_directory_path)
-    for image_info in images_info:
-        relative_path = image_info.get("relative_path")
+    return {
+        'output_directory_path': output_directory_path,
+        'with_id': with_id,
+        'prefix': prefix,
+        'sufix': sufix,
+        'export_mode': export_mode,
+        # Sidecar: tamanho e hash do conteúdo de cada saída da última exportação
+        'entries': load_export_sidecar(output_directory_path),
+        'parent_dirs': set(),
+        'executor': ThreadPoolExecutor(),
+        'futures': []
+    }
+
+def submit_export(export, image_info):
+    output_directory_path = export.get('output_directory_path')
+    relative_path = image_info.get("relative_path")
+
+    if export.get('with_id'):
+        filename = f"{relative_path.stem}--{image_info['id']}{relative_path.suffix}"
+        output_path = output_directory_path / relative_path.parent / filename
+    else:
+        output_path = output_directory_path / relative_path
 
-        if with_id:
-            filename = f"{relative_path.stem}--{image_info['id']}{relative_path.suffix}"
-            output_path = output_directory_path / relative_path.parent / filename
-        else:
-            output_path = output_directory_path / relative_path
+    if export.get('prefix'):
+        output_path = output_path.with_name(f"{export.get('prefix')}{output_path.name}")
 
-        if prefix:
-            output_path = output_path.with_name(f"{prefix}{output_path.name}")
+    if export.get('sufix'):
+        output_path = output_path.with_name(f"{output_path.stem}{export.get('sufix')}{output_path.suffix}")
 
-        if sufix:
-            output_path = output_path.with_name(f"{output_path.stem}{sufix}{output_path.suffix}")
+    # Uma criação por pasta distinta, não uma por imagem
+    if output_path.parent not in export.get('parent_dirs'):
+        output_path.parent.mkdir(parents=True, exist_ok=True)
+        export.get('parent_dirs').add(output_path.parent)
 
-        ensure_path(output_path.parent).mkdir(parents=True, exist_ok=True)
+    image_info["external_output_path"] = output_path
+    entry = export.get('entries').get(str(output_path.relative_to(output_directory_path)))
+    export.get('futures').append(export.get('executor').submit(export_image, export.get('export_mode'), (image_info, entry)))
 
-        image_info["external_output_path"] = output_path
+def finish_export(export):
+    success_images_info = []
+    error_images_info = []
+    output_directory_path = export.get('output_directory_path')
+    entries = export.get('entries')
 
-    with ThreadPoolExecutor() as executor:
-        copy_results = list(executor.map(export_image, images_info))
-        for image_info in copy_results:
-            if image_info.get('status'):
-                success_images_info.append(image_info)
-            else:
-                error_images_info.append(image_info)
+    outcomes = {}
+    for future in export.get('futures'):
+        image_info, entry, outcome = future.result()
+        outcomes[outcome] = outcomes.get(outcome, 0) + 1
+        if image_info.get('status'):
+            entries[str(image_info['external_output_path'].relative_to(output_directory_path))] = entry
+            success_images_info.append(image_info)
+        else:
+            error_images_info.append(image_info)
+    export.get('executor').shutdown()
 
+    save_export_sidecar(output_directory_path, entries)
+    print_log(outcomes, title=f"Exportação ({export.get('export_mode')})", level=2)
+
+    # Guarda external_output_path no manifesto: a sessão retomada sabe para onde cada imagem foi exportada
+    record_images(success_images_info)
     return success_images_info, error_images_info
 
-def save_new_image(image_info, new_img, format=None, dpi=None, quality=None, optimize=True, extra_args=None):
+def export_images(images_info, output_directory_path, with_id = False, prefix = None, sufix = None, export_mode = 'auto'):
+    export = start_export(output_directory_path, with_id, prefix, sufix, export_mode)
+    for image_info in images_info:
+        submit_export(export, image_info)
+    return finish_export(export)
+
+def new_image_record(image_info, format=None):
     old_image_info = None
     images_folder_path = get_session_images_path(image_info.get('session_id'))
-    new_image_info = copy.deepcopy(image_info)
+    new_image_info = as_record(image_info).copy()
     new_image_info['id'] = new_uuid()
+    # O resultado da busca de qualidade vale só para a codificação que o gerou
+    new_image_info.pop('encode_search', None)
     
     if image_info.get('id') is not None:
         new_image_info['old_id'] = image_info.get('id')
@@ -192,7 +451,7 @@ def save_new_image(image_info, new_img, format=None, dpi=None, quality=None, opt
         ext = image_info.get('path').suffix
     
     filename = f'{image_info.get("external_source_path").stem}{ext}'
-    id_filename = f"{new_image_info.get("id")}--{filename}"
+    id_filename = f"{new_image_info.get('id')}--{filename}"
     new_image_info['path'] = images_folder_path / id_filename
     
     # 🔑 atualiza também o "external_source_path" para refletir o novo formato
@@ -200,7 +459,10 @@ def save_new_image(image_info, new_img, format=None, dpi=None, quality=None, opt
     if "relative_path" in image_info:
         old_relative = image_info["relative_path"]
         new_image_info["relative_path"] = ensure_path(old_relative).with_suffix(ext)
-    
+
+    return new_image_info, old_image_info
+
+def get_save_args(path, format=None, dpi=None, quality=None, optimize=True, extra_args=None):
     save_args = {'optimize': optimize}
     if format is not None:
         save_args['format'] = format
@@ -210,12 +472,253 @@ def save_new_image(image_info, new_img, format=None, dpi=None, quality=None, opt
         save_args['quality'] = quality
     if extra_args is not None:
         save_args |= extra_args
-    
-    new_img.save(new_image_info.get('path'), **save_args)
+
+    if save_args.get('format') is None:
+        save_args['format'] = Image.registered_extensions().get(path.suffix.lower())
+    if save_args.get('format') == 'AVIF':
+        # Threads do codificador dentro do orçamento da tarefa (o padrão do plugin é um por núcleo)
+        save_args.setdefault('max_threads', get_task_threads())
+    return save_args
+
+def write_new_image(new_image_info, old_image_info, encoded):
+    with stage('write', bytes_written=encoded.nbytes):
+        with open(new_image_info.get('path'), 'wb') as file:
+            file.write(encoded)
     new_image_info['status'] = True
+    record_image(new_image_info)
+
+    return new_image_info, old_image_info
+
+def save_new_image(image_info, new_img, format=None, dpi=None, quality=None, optimize=True, extra_args=None):
+    new_image_info, old_image_info = new_image_record(image_info, format)
+    save_args = get_save_args(new_image_info.get('path'), format, dpi, quality, optimize, extra_args)
+
+    # Codifica em memória e grava de uma vez: codificação e escrita aparecem separadas nas métricas.
+    # ImageBuffer (array do OpenCV) vai direto para o cv2.imencode quando o formato permite
+    with stage('encode', format=save_args.get('format')) as event:
+        encoded = None
+        if isinstance(new_img, ImageBuffer):
+            if dpi is None and extra_args is None:
+                encoded = encode_buffer(new_img, save_args.get('format'), quality, optimize)
+            if encoded is None:
+                new_img = new_img.to_pil()
+        if encoded is None:
+            buffer = io.BytesIO()
+            new_img.save(buffer, **save_args)
+            encoded = buffer.getbuffer()
+        event['encoder'] = 'pillow' if isinstance(new_img, Image.Image) else 'opencv'
+
+    return write_new_image(new_image_info, old_image_info, encoded)
+
+def save_searched_image(image_info, new_img, target, format=None, dpi=None, optimize=True, extra_args=None):
+    # Como save_new_image, mas a qualidade sai da busca por --target_kb/--target_ssim (ver encode_search)
+    new_image_info, old_image_info = new_image_record(image_info, format)
+    save_args = get_save_args(new_image_info.get('path'), format, dpi, None, optimize, extra_args)
+
+    with stage('encode_search', format=save_args.get('format')) as event:
+        encoded, result = search_quality(new_img, save_args, threads=get_task_threads(), **target)
+        event.update(result)
+    new_image_info['encode_search'] = result
+
+    return write_new_image(new_image_info, old_image_info, encoded)
+
+def save_cached_image(image_info, cached_path):
+    new_image_info, old_image_info = new_image_record(image_info, cached_path.suffix[1:])
+    # Entradas do cache nunca são alteradas no lugar (só substituídas com os.replace): hardlink é seguro
+    status, error, _ = link_file(cached_path, new_image_info.get('path'), 'hardlink')
+    if not status:
+        raise OSError(error)
+    new_image_info['status'] = True
+    record_image(new_image_info)
+
+    return new_image_info, old_image_info
+
+def decode_image(img, path):
+    # Pillow decodifica sob demanda: load() explícito separa a decodificação da transformação
+    with stage('decode', bytes_read=os.path.getsize(path), pixels=img.width * img.height):
+        img.load()
+    return img
+
+def should_tile_image(image_info, format = None):
+    with Image.open(image_info.get('path')) as img:
+        size = img.size
+    ext = f'.{format.lower()}' if format else ensure_path(image_info.get('path')).suffix
+    return should_tile(size, ext)
+
+def tiled_image(image_info, steps, format = None, dpi = None, quality = None, img = None):
+    with stage('decode', bytes_read=os.path.getsize(image_info.get('path')), tiled=True):
+        source, mode = load_scratch(image_info.get('path'), img)
+
+    for action, params in steps:
+        height, width = source.shape[:2]
+        with stage('transform', op=action, tiled=True):
+            source, mode = tiled_step(source, mode, action, params, width, height)
+
+    new_image_info, old_image_info = new_image_record(image_info, format)
+    # Codificação e escrita acontecem juntas, faixa a faixa
+    with stage('write', tiled=True) as event:
+        write_tiled(source, mode, new_image_info.get('path'), format, dpi, quality)
+        event['bytes_written'] = os.path.getsize(new_image_info.get('path'))
+    new_image_info['status'] = True
+    record_image(new_image_info)
+
+    return new_image_info, old_image_info
+
+def tiled_step(source, mode, action, params, width, height):
+    match action:
+        case 'crop':
+            source = tiled_crop(source, get_crop_box((width, height), **params))
+        case 'resize':
+            size, algorithm = get_resize_plan((width, height), **params)
+            source = tiled_resize(source, mode, size, algorithm)
+        case 'resize_to':
+            source = tiled_resize(source, mode, params.get('size'), params.get('algorithm'))
+        case 'remove_noise':
+            source, mode = tiled_filter(source, partial(apply_denoise, settings=params), get_denoise_halo(params), mode)
+        case 'flatten':
+            source, mode = tiled_flatten(source, mode, hex_to_rgb(params.get('background_color')))
+    return source, mode
+
+def run_cached(operation, worker, config):
+    image_info = config.get('image_info')
+    params = {key: value for key, value in config.items() if key != 'image_info'}
+
+    try:
+        key = cache_key(image_info.get('path'), operation, params)
+        cached_path = get_cached_path(key)
+        if cached_path is not None:
+            new_image_info, old_image_info = save_cached_image(image_info, cached_path)
+            new_image_info['cache'] = 'hit'
+            new_image_info['cache_key'] = key
+            return new_image_info, old_image_info
+    except OSError:
+        # Origem ilegível ou entrada sumiu no meio: o worker reporta o erro normalmente
+        return worker(config)
+
+    new_image_info, old_image_info = worker(config)
+    if new_image_info.get('status'):
+        try:
+            store_cached(key, new_image_info.get('path'))
+            new_image_info['cache'] = 'miss'
+            new_image_info['cache_key'] = key
+        except OSError as e:
+            print_log(f"Falha ao gravar no cache '{new_image_info.get('path')}': {e}", type='warning', level=2)
 
     return new_image_info, old_image_info
 
+def image_cost(image_info):
+    # Pixels pelo cabeçalho (Image.open não decodifica); sem cabeçalho legível, o tamanho do arquivo
+    path = image_info.get('path')
+    try:
+        with Image.open(path) as img:
+            return img.width * img.height
+    except (OSError, UnidentifiedImageError):
+        try:
+            return os.path.getsize(path)
+        except OSError:
+            return 0
+
+def get_image_costs(images_info):
+    # Com um worker só a ordem não muda o tempo total: nem abre os cabeçalhos
+    if get_pool_size() == 1:
+        return None
+    return [image_cost(image_info) for image_info in images_info]
+
+def run_with_params(worker, params, image_info):
+    # Roda no worker: params é o bloco compartilhado, enviado uma vez por pedaço e não uma vez por imagem.
+    # Cópia do registro: com executor thread/inline, erros marcados pelo worker não alteram o original
+    return worker({'image_info': image_info.copy()} | params)
+
+def run_image_task(worker, params, image_info):
+    # O registro antigo é o próprio image_info: o processo principal já o tem, não volta pelo pipe
+    new_image_info, old_image_info = run_with_params(worker, params, image_info)
+    return new_image_info, bool(old_image_info)
+
+def map_cached(operation, worker, images_info, params, on_result = None):
+    # Maiores imagens primeiro, em pedaços por custo; on_result recebe cada resultado assim que termina
+    if cache.CACHE_ENABLED:
+        worker = partial(run_cached, operation, worker)
+    task = partial(run_image_task, worker, params)
+    results = [
+        (new_image_info, image_info if has_old else None)
+        for (new_image_info, has_old), image_info in zip(
+            map_scheduled(operation, task, images_info, get_image_costs(images_info), on_result), images_info
+        )
+    ]
+
+    if cache.CACHE_ENABLED:
+        for new_image_info, _ in results:
+            record_cache_result(new_image_info)
+        enforce_cache_budget()
+
+    return results
+
+def split_results(results):
+    new_images_info = []
+    old_images_info = []
+    error_images_info = []
+
+    for new_image_info, old_image_info in results:
+        if new_image_info.get('status'):
+            new_images_info.append(new_image_info)
+            if old_image_info is not None:
+                old_images_info.append(old_image_info)
+        else:
+            error_images_info.append(new_image_info)
+
+    return new_images_info, old_images_info, error_images_info
+
+def get_resize_plan(size, width = None, height = None, dpi = 300, scale = 'mm'):
+    original_width, original_height = size
+
+    if scale == 'percentage':
+        width_px = original_width * (width / 100)
+        height_px = original_height * (height / 100)
+    else:
+        match scale:
+            case 'px':
+                pts_divider = dpi
+            case 'mm':
+                pts_divider = 25.4
+            case 'cm':
+                pts_divider = 2.54
+            case 'm':
+                pts_divider = 0.0254
+            case 'in':
+                pts_divider = 1
+            case _:
+                pts_divider = 25.4
+
+        width_px = width * dpi / pts_divider
+        height_px = height * dpi / pts_divider
+
+    if width_px > original_width and height_px > original_height:
+        algorithm = Image.BICUBIC
+    else:
+        algorithm = Image.LANCZOS
+
+    return (int(width_px), int(height_px)), algorithm
+
+def prepare_reduced_decode(img, size):
+    # JPEG ainda não decodificado: libjpeg reduz no domínio DCT (1/2, 1/4, 1/8) mantendo
+    # pelo menos RESIZE_DRAFT_MARGIN x o tamanho final para o filtro final ter margem.
+    # True se o draft foi aplicado (só JPEG aceita)
+    if size[0] < img.width and size[1] < img.height:
+        return img.draft(img.mode, (size[0] * RESIZE_DRAFT_MARGIN, size[1] * RESIZE_DRAFT_MARGIN)) is not None
+    return False
+
+def resize_planned(img, size, algorithm, exact = False):
+    if exact or size[0] >= img.width or size[1] >= img.height:
+        return img.resize(size, algorithm)
+    # reduce() por fator inteiro antes do filtro de alta qualidade
+    return img.resize(size, algorithm, reducing_gap=RESIZE_REDUCING_GAP)
+
+def resize_img(img, width = None, height = None, dpi = 300, scale = 'mm', exact = False):
+    size, algorithm = get_resize_plan(img.size, width, height, dpi, scale)
+    if not exact:
+        prepare_reduced_decode(img, size)
+    return resize_planned(img, size, algorithm, exact)
+
 def resize_image(config):
     try:
         image_info = config.get('image_info')
@@ -223,38 +726,21 @@ def resize_image(config):
         height = config.get('height')
         dpi = config.get('dpi')
         scale = config.get('scale')
+        exact = config.get('exact')
 
         with Image.open(image_info.get('path')) as img:
-            
-            original_width, original_height = img.size
-
-            if scale == 'percentage':
-                width_px = original_width * (width / 100)
-                height_px = original_height * (height / 100)
-            else:
-                match scale:
-                    case 'px':
-                        pts_divider = dpi
-                    case 'mm':
-                        pts_divider = 25.4
-                    case 'cm':
-                        pts_divider = 2.54
-                    case 'm':
-                        pts_divider = 0.0254
-                    case 'in':
-                        pts_divider = 1
-                    case _:
-                        pts_divider = 25.4
-
-                width_px = width * dpi / pts_divider
-                height_px = height * dpi / pts_divider
-
-            if width_px > original_width and height_px > original_height:
-                algorithm = Image.BICUBIC
-            else:
-                algorithm = Image.LANCZOS
-
-            resized = img.resize((int(width_px), int(height_px)), algorithm)
+            # Plano calculado sobre o tamanho original, antes de qualquer draft
+            size, algorithm = get_resize_plan(img.size, width, height, dpi, scale)
+            reduced = not exact and prepare_reduced_decode(img, size)
+
+            if should_tile(img.size, ensure_path(image_info.get('path')).suffix):
+                params = {'size': size, 'algorithm': algorithm}
+                # Só a imagem com draft precisa ser reaproveitada; sem ele, load_scratch mapeia PPM direto do arquivo
+                return tiled_image(image_info, [('resize_to', params)], img=img if reduced else None)
+
+            decode_image(img, image_info.get('path'))
+            with stage('transform', op='resize'):
+                resized = resize_planned(img, size, algorithm, exact)
             return save_new_image(image_info, resized)
         
     except FileNotFoundError:
@@ -275,34 +761,15 @@ def resize_image(config):
 
     return image_info, []
 
-def resize_images(images_info, width = None, height = None, dpi = 300, scale = 'mm'):
-    old_images_info = []
-    new_images_info = []
-    error_images_info = []
-    configs = []
-
-    for image_info in images_info:
-        config = {
-            'image_info': image_info,
-            'width': width,
-            'height': height,
-            'dpi': dpi,
-            'scale': scale
-        }
-        configs.append(config)
-
-    with Pool(processes=cpu_count()) as pool:
-        resize_results = pool.map(resize_image, configs)
-
-    for new_image_info, old_image_info in resize_results:
-        if new_image_info.get('status'):
-            new_images_info.append(new_image_info)
-            if isinstance(old_image_info, dict):
-                old_images_info.append(old_image_info)
-        else:
-            error_images_info.append(new_image_info)
-
-    return new_images_info, old_images_info, error_images_info
+def resize_images(images_info, width = None, height = None, dpi = 300, scale = 'mm', exact = False):
+    params = {
+        'width': width,
+        'height': height,
+        'dpi': dpi,
+        'scale': scale,
+        'exact': exact
+    }
+    return split_results(map_cached('resize', resize_image, images_info, params))
 
 def convert_to_px(value, scale, dpi = 300, total_size = None):
     try:
@@ -322,6 +789,21 @@ def convert_to_px(value, scale, dpi = 300, total_size = None):
     except Exception as e:
         raise ValueError(f'Erro ao converter escala "{scale}": {e}')
 
+def trim_img(img):
+    # Garante que tenha alpha para processar
+    if img.mode in ("RGBA", "LA"):
+        # Pega o canal alpha
+        alpha = img.split()[-1]
+        # bounding box dos pixels não transparentes
+        bbox = alpha.getbbox()
+
+        if bbox:
+            return img.crop(bbox)
+        # imagem é totalmente transparente → retorna ela mesmo
+        return img
+    # Sem canal alpha → retorna ela mesmo
+    return img
+
 def trim_transparent_borders(config):
     try:
         image_info = config.get('image_info')
@@ -335,22 +817,9 @@ def trim_transparent_borders(config):
         dpi = config.get('dpi')
 
         with Image.open(image_info.get('path')) as img:
-            # Garante que tenha alpha para processar
-            if img.mode in ("RGBA", "LA"):
-                # Pega o canal alpha
-                alpha = img.split()[-1]
-                # bounding box dos pixels não transparentes
-                bbox = alpha.getbbox()
-
-                if bbox:
-                    trimmed = img.crop(bbox)
-                else:
-                    # imagem é totalmente transparente → retorna ela mesmo
-                    trimmed = img
-            else:
-                # Sem canal alpha → retorna ela mesmo
-                trimmed = img
-
+            decode_image(img, image_info.get('path'))
+            with stage('transform', op='trim'):
+                trimmed = trim_img(img)
             return save_new_image(image_info, trimmed)
 
     except FileNotFoundError:
@@ -367,6 +836,46 @@ def trim_transparent_borders(config):
 
     return image_info, []
 
+def rgb_to_lab(rgb):
+    # float32 em [0, 1] → L* [0, 100], a*/b* sem offset (distância ΔE76)
+    return cv2.cvtColor(rgb.astype(np.float32) / 255, cv2.COLOR_RGB2Lab)
+
+def remove_background_img(img, color, threshold = 0, distance = 'rgb', softness = 0):
+    target_rgb = np.array(hex_to_rgb(color), dtype=np.int32)
+    data = np.array(img.convert("RGBA"))
+    height = data.shape[0]
+
+    match(distance):
+        case 'rgb':
+            # Tabela (valor - alvo)² por canal: a distância vira três lookups e duas somas
+            luts = [(np.arange(256, dtype=np.int32) - channel) ** 2 for channel in target_rgb]
+        case 'lab':
+            target = rgb_to_lab(target_rgb.reshape(1, 1, 3)).reshape(3)
+        case _:
+            raise ValueError(f'Distância não suportada: {distance}')
+
+    # Processa em faixas de linhas para manter os temporários limitados
+    for top in range(0, height, BG_STRIP_ROWS):
+        strip = data[top:top + BG_STRIP_ROWS]
+
+        if distance == 'lab':
+            diff = rgb_to_lab(strip[..., :3]) - target
+            squared = np.einsum('ijk,ijk->ij', diff, diff)
+        else:
+            squared = luts[0][strip[..., 0]] + luts[1][strip[..., 1]] + luts[2][strip[..., 2]]
+
+        # Comparação com o quadrado evita sqrt e mantém o <= exato da versão por pixel
+        removed = squared <= threshold ** 2
+        strip[removed] = (255, 255, 255, 0)
+
+        if softness > 0:
+            dist = np.sqrt(squared, dtype=np.float32)
+            ramp = (dist > threshold) & (dist < threshold + softness)
+            factor = (dist[ramp] - threshold) / softness
+            strip[..., 3][ramp] = (strip[..., 3][ramp] * factor).astype(np.uint8)
+
+    return Image.fromarray(data, "RGBA")
+
 def remove_background_exact(config):
     try:
         image_info = config.get('image_info')
@@ -379,27 +888,13 @@ def remove_background_exact(config):
         color = config.get('color')
         dpi = config.get('dpi')
         threshold = config.get('threshold')
+        distance = config.get('distance')
+        softness = config.get('softness')
 
-        target_rgb = hex_to_rgb(color)
-
-        with Image.open(image_info.get('path')).convert("RGBA") as img:
-            datas = img.getdata()
-            new_data = []
-
-            for item in datas:
-                r, g, b, a = item
-
-                dist = ((r - target_rgb[0]) ** 2 +
-                        (g - target_rgb[1]) ** 2 +
-                        (b - target_rgb[2]) ** 2) ** 0.5
-
-                if dist <= threshold:
-                    new_data.append((255, 255, 255, 0))
-                else:
-                    new_data.append(item)
-
-            img.putdata(new_data)
-
+        with Image.open(image_info.get('path')) as img:
+            decode_image(img, image_info.get('path'))
+            with stage('transform', op='remove_background'):
+                img = remove_background_img(img, color, threshold, distance, softness)
             return save_new_image(image_info, img, format='PNG')
 
     except FileNotFoundError:
@@ -416,6 +911,24 @@ def remove_background_exact(config):
 
     return image_info, []
 
+def get_crop_box(size, left = 0, right = 0, top = 0, bottom = 0, scale = 'px', dpi = 300):
+    original_width, original_height = size
+
+    left_px = convert_to_px(left, scale, dpi, original_width)
+    right_px = convert_to_px(right, scale, dpi, original_width)
+    top_px = convert_to_px(top, scale, dpi, original_height)
+    bottom_px = convert_to_px(bottom, scale, dpi, original_height)
+
+    return (
+        left_px,
+        top_px,
+        original_width - right_px,
+        original_height - bottom_px
+    )
+
+def cut_border_img(img, left = 0, right = 0, top = 0, bottom = 0, scale = 'px', dpi = 300):
+    return img.crop(get_crop_box(img.size, left, right, top, bottom, scale, dpi))
+
 def edit_border_image(config):
     image_info = config.get('image_info')
     left = config.get('left')
@@ -428,22 +941,14 @@ def edit_border_image(config):
     dpi = config.get('dpi')
 
     try:
-        with Image.open(image_info.get('path')) as img:
-            original_width, original_height = img.size
-
-            left_px = convert_to_px(left, scale, dpi, original_width)
-            right_px = convert_to_px(right, scale, dpi, original_width)
-            top_px = convert_to_px(top, scale, dpi, original_height)
-            bottom_px = convert_to_px(bottom, scale, dpi, original_height)
-
-            crop_box = (
-                left_px,
-                top_px,
-                original_width - right_px,
-                original_height - bottom_px
-            )
+        if should_tile_image(image_info):
+            params = {'left': left, 'right': right, 'top': top, 'bottom': bottom, 'scale': scale, 'dpi': dpi}
+            return tiled_image(image_info, [('crop', params)])
 
-            cropped_img = img.crop(crop_box)
+        with Image.open(image_info.get('path')) as img:
+            decode_image(img, image_info.get('path'))
+            with stage('transform', op='cut'):
+                cropped_img = cut_border_img(img, left, right, top, bottom, scale, dpi)
             return save_new_image(image_info, cropped_img)
 
     except FileNotFoundError:
@@ -464,47 +969,87 @@ def edit_border_image(config):
 
     return image_info, []
     
-def edit_border_images(images_info, left=0, right=0, top=0, bottom=0, scale='px', type = 'cut', color = None, dpi = 300, threshold = 0):
-    old_images_info = []
-    new_images_info = []
-    error_images_info = []
-    configs = []
+def edit_border_images(images_info, left=0, right=0, top=0, bottom=0, scale='px', type = 'cut', color = None, dpi = 300, threshold = 0, distance = 'rgb', softness = 0):
+    params = {
+        'left': left,
+        'right': right,
+        'top': top,
+        'bottom': bottom,
+        'scale': scale,
+        'type': type,
+        'color': color,
+        'dpi': dpi,
+        'threshold': threshold,
+        'distance': distance,
+        'softness': softness
+    }
+
+    match(type):
+        case 'cut':
+            cropped_results = map_cached('crop', edit_border_image, images_info, params)
+        case 'trim':
+            cropped_results = map_cached('crop', trim_transparent_borders, images_info, params)
+        case 'bg':
+            cropped_results = map_cached('crop', remove_background_exact, images_info, params)
+
+    return split_results(cropped_results)
+
+def prepare_word_image(config):
+    image_info = config.get('image_info')
+    dpi = config.get('dpi')
+    print_dpi = config.get('print_dpi')
+    image_format = config.get('image_format')
+    quality = config.get('quality')
 
-    for image_info in images_info:
-        config = {
-            'image_info': image_info,
-            'left': left,
-            'right': right,
-            'top': top,
-            'bottom': bottom,
-            'scale': scale,
-            'type': type,
-            'color': color,
-            'dpi': dpi,
-            'threshold': threshold
-        }
-        configs.append(config)
-
-    with Pool(processes=cpu_count()) as pool:
-        match(type):
-            case 'cut':
-                cropped_results = pool.map(edit_border_image, configs)
-            case 'trim':
-                cropped_results = pool.map(trim_transparent_borders, configs)
-            case 'bg':
-                cropped_results = pool.map(remove_background_exact, configs)
-
-    for new_image_info, old_image_info in cropped_results:
-        if new_image_info.get('status'):
-            new_images_info.append(new_image_info)
-            if isinstance(old_image_info, dict):
-                old_images_info.append(old_image_info)
-        else:
-            error_images_info.append(new_image_info)
+    try:
+        with Image.open(image_info.get('path')) as img:
+            width_px, height_px = img.size
+            image_dpi = dpi or img.info.get('dpi', (72, 72))[0]
 
-    return new_images_info, old_images_info, error_images_info
+            picture = {
+                'width_in': width_px / image_dpi,
+                'height_in': height_px / image_dpi,
+                'data': None
+            }
+
+            if print_dpi:
+                # Reamostra para o tamanho impresso: o .docx passa a escalar com o papel, não com a origem
+                target_size = (
+                    max(1, round(picture['width_in'] * print_dpi)),
+                    max(1, round(picture['height_in'] * print_dpi))
+                )
+                if target_size[0] < width_px:
+                    img = img.resize(target_size, Image.LANCZOS)
+
+                buffer = io.BytesIO()
+                if image_format == 'jpeg':
+                    flatten_jpeg_img(img).save(buffer, format="JPEG", quality=quality, dpi=(print_dpi, print_dpi))
+                else:
+                    img.save(buffer, format="PNG", dpi=(print_dpi, print_dpi))
+                picture['data'] = buffer.getvalue()
+
+            image_info['status'] = True
+            return image_info, picture
+
+    except FileNotFoundError:
+        error = f"Arquivo não encontrado: {image_info.get('path')}"
+    except UnidentifiedImageError:
+        error = f"Arquivo não é uma imagem válida: {image_info.get('path')}"
+    except OSError as e:
+        error = f"Falha ao processar imagem '{image_info.get('path')}': {e}"
+    except ValueError as e:
+        error = f"Valor inválido ao salvar '{image_info.get('path')}': {e}"
+    except KeyError as e:
+        error = f"Formato não suportado para '{image_info.get('path')}': {e}"
+    except Exception as e:
+        error = f"Erro inesperado com '{image_info.get('path')}': {e}"
 
-def export_to_word(images_info, output_directory_path, dpi = None, file_name = None):
+    image_info['status'] = False
+    image_info['error'] = error
+
+    return image_info, None
+
+def export_to_word(images_info, output_directory_path, dpi = None, file_name = None, print_dpi = None, image_format = 'jpeg', quality = 90):
     success_images_info = []
     error_images_info = []
 
@@ -518,44 +1063,38 @@ def export_to_word(images_info, output_directory_path, dpi = None, file_name = N
     section.right_margin = Inches(1)
     section.left_margin = Inches(1)
 
-    for image_info in images_info:
-        error = None
-        try:
-            with Image.open(image_info.get('path')) as img:
-                width_px, height_px = img.size
-                image_dpi = dpi or img.info.get('dpi', (72, 72))[0]
+    configs = (
+        {
+            'image_info': image_info,
+            'dpi': dpi,
+            'print_dpi': print_dpi,
+            'image_format': image_format,
+            'quality': quality
+        }
+        for image_info in images_info
+    )
 
-                width_in = width_px / image_dpi
-                height_in = height_px / image_dpi
+    # Workers leem tamanho/DPI e preparam as imagens; o documento é montado em ordem no processo principal
+    for image_info, picture in imap_bounded(prepare_word_image, configs):
+        if not image_info.get('status'):
+            error_images_info.append(image_info)
+            continue
 
-                paragraph = doc.add_paragraph()
-                paragraph.alignment = WD_ALIGN_PARAGRAPH.CENTER
+        try:
+            paragraph = doc.add_paragraph()
+            paragraph.alignment = WD_ALIGN_PARAGRAPH.CENTER
 
-                run = paragraph.add_run()
-                run.add_picture(str(image_info.get('path')), width=Inches(width_in), height=Inches(height_in))
+            run = paragraph.add_run()
+            source = io.BytesIO(picture['data']) if picture['data'] is not None else str(image_info.get('path'))
+            run.add_picture(source, width=Inches(picture['width_in']), height=Inches(picture['height_in']))
 
-                doc.add_page_break()
+            doc.add_page_break()
+            success_images_info.append(image_info)
 
-        except FileNotFoundError:
-            error = f"Arquivo não encontrado: {image_info.get('path')}"
-        except UnidentifiedImageError:
-            error = f"Arquivo não é uma imagem válida: {image_info.get('path')}"
-        except OSError as e:
-            error = f"Falha ao processar imagem '{image_info.get('path')}': {e}"
-        except ValueError as e:
-            error = f"Valor inválido ao salvar '{image_info.get('path')}': {e}"
-        except KeyError as e:
-            error = f"Formato não suportado para '{image_info.get('path')}': {e}"
         except Exception as e:
-            error = f"Erro inesperado com '{image_info.get('path')}': {e}"
-        
-        if error:
-            image_info['error'] = error
+            image_info['error'] = f"Erro inesperado com '{image_info.get('path')}': {e}"
             image_info['status'] = False
             error_images_info.append(image_info)
-        else:
-            image_info['status'] = True
-            success_images_info.append(image_info)
 
     if doc.paragraphs[-1].text == '':
         doc.paragraphs[-1]._element.getparent().remove(doc.paragraphs[-1]._element)
@@ -576,33 +1115,35 @@ def rotate_if_needed(img):
 def create_pdf_page(config):
     image_info = config.get('image_info')
     dpi = config.get('dpi')
+    quality = config.get('quality')
 
     try:
         with Image.open(image_info.get('path')) as img:
+            image_dpi = dpi or img.info.get('dpi', (72, 72))[0]
+            decode_image(img, image_info.get('path'))
 
             if img.mode in ("RGBA", "LA"):
                 background = Image.new("RGB", img.size, (255, 255, 255))
-                background.paste(img, mask=img.split()[3])
+                background.paste(img, mask=img.split()[-1])
                 img = background
             else:
                 img = img.convert("RGB")
 
             img = rotate_if_needed(img)
 
-            img_width, img_height = img.size
-            image_dpi = dpi or img.info.get('dpi', (72, 72))[0]
-
-            A4_WIDTH_PX = int(8.27 * image_dpi)
-            A4_HEIGHT_PX = int(11.69 * image_dpi)
-            A4_SIZE = (A4_WIDTH_PX, A4_HEIGHT_PX)
-
-            x = (A4_WIDTH_PX - img_width) // 2
-            y = (A4_HEIGHT_PX - img_height) // 2
+            # A página é montada direto no PDF: só a imagem codificada volta para o processo principal
+            with stage('encode', format='JPEG'):
+                buffer = io.BytesIO()
+                img.save(buffer, format="JPEG", quality=quality)
+            page = {
+                'data': buffer.getvalue(),
+                'width': img.width,
+                'height': img.height,
+                'dpi': image_dpi
+            }
 
-            page = Image.new("RGB", A4_SIZE, (255, 255, 255))
-            page.paste(img, (x, y))
-            
-            return save_new_image(image_info, page)
+            image_info['status'] = True
+            return image_info, page
 
     except FileNotFoundError:
         error = f"Arquivo não encontrado: {image_info.get('path')}"
@@ -622,48 +1163,39 @@ def create_pdf_page(config):
 
     return image_info, None
 
-def export_to_pdf(images_info, output_directory_path, dpi=None, file_name = None):
+def export_to_pdf(images_info, output_directory_path, dpi=None, file_name = None, quality = 95):
     success_images_info = []
     error_images_info = []
-    configs = []
-    images = []
-    
+
     file_name = f'pdf_of_images.pdf' if file_name is None else f'{file_name}.pdf'
     output_directory_path = ensure_path(output_directory_path)
     output_pdf_path =  output_directory_path / file_name
-    
-    # c = canvas.Canvas(str(output_pdf_path), pagesize=A4)
 
-    for image_info in images_info:
-        config = {
+    configs = (
+        {
             'image_info': image_info,
-            'dpi': dpi
+            'dpi': dpi,
+            'quality': quality
         }
-        configs.append(config)
-
-    with Pool(processes=cpu_count()) as pool:
-        pages_result = pool.map(create_pdf_page, configs)
+        for image_info in images_info
+    )
 
-    for image_info, old_image_info in pages_result:
-        if image_info.get('status'):
-            img = Image.open(image_info.get('path'))
-            images.append(img)
-            success_images_info.append(old_image_info)
-        else:
-            error_images_info.append(image_info)
+    with PdfStreamWriter(output_pdf_path) as pdf:
+        # Páginas são escritas na ordem conforme os workers terminam, com janela limitada em voo
+        for image_info, page in imap_bounded(create_pdf_page, configs):
+            if not image_info.get('status'):
+                error_images_info.append(image_info)
+                continue
 
-    resolution = dpi or images[0].info.get('dpi', (72, 72))[0]
-    if images:
-        images[0].save(
-            output_pdf_path,
-            save_all=True,
-            append_images=images[1:],
-            resolution=resolution,
-            optimize=True
-        )
+            # Imagem centralizada em uma página A4 no tamanho físico dado pelo DPI
+            width_pt = page.get('width') * 72 / page.get('dpi')
+            height_pt = page.get('height') * 72 / page.get('dpi')
+            x = (A4[0] - width_pt) / 2
+            y = (A4[1] - height_pt) / 2
 
-        for img in images:
-            img.close()
+            image_id = pdf.add_image(page.get('data'), page.get('width'), page.get('height'))
+            pdf.add_page(A4[0], A4[1], draw_image_op('Im0', x, y, width_pt, height_pt), {'Im0': image_id})
+            success_images_info.append(image_info)
 
     return success_images_info, error_images_info
 
@@ -701,31 +1233,20 @@ def get_from_grid(config):
                 )
                 relative_path = parent_relative / f"{original_name}_{row}_{col}.png"
 
-                new_image_info = {
-                    'external_source_path': relative_path,
-                    'path': relative_path,
-                    'relative_path': relative_path,
-                    'session_id': image_info.get('session_id')
-                }
+                new_image_info = ImageRecord(
+                    external_source_path=relative_path,
+                    path=relative_path,
+                    relative_path=relative_path,
+                    session_id=image_info.get('session_id')
+                )
                 new_image_info = save_new_image(new_image_info, cropped)
                 new_images_info.append(new_image_info)
         
         return new_images_info
 
 def images_from_grid(images_info, rows = 1, cols = 1):
-    new_images_info = []
-    configs = []
-
-    for image_info in images_info:
-        config = {
-            'image_info': image_info,
-            'cols': cols,
-            'rows': rows
-        }
-        configs.append(config)
-
-    with Pool(processes=cpu_count()) as pool:
-        cropped_results = pool.map(get_from_grid, configs)
+    task = partial(run_with_params, get_from_grid, {'cols': cols, 'rows': rows})
+    cropped_results = map_scheduled('from_grid', task, images_info, get_image_costs(images_info))
 
     new_images_info = [img[0] for sublist in cropped_results for img in sublist]
 
@@ -750,23 +1271,36 @@ def hex_to_rgb(hex_color):
         raise ValueError(f"Cor hexadecimal inválida: {hex_color}")
     return tuple(int(hex_color[i:i+2], 16) for i in (0, 2, 4))
 
+def flatten_jpeg_img(img, background_color = '#FFFFFF'):
+    bg_rgb = hex_to_rgb(background_color)
+
+    if img.mode in ("RGBA", "LA"):
+        background = Image.new("RGB", img.size, bg_rgb)
+        background.paste(img, mask=img.split()[-1])
+        return background
+    elif img.mode != "RGB":
+        return img.convert("RGB")
+    return img
+
 def convert_to_jpeg(config):
     image_info = config.get('image_info')
     background_color = config.get('background_color')
     dpi = config.get('dpi')
     quality = config.get('quality')
+    target = config.get('target')
 
     try:
-        with Image.open(image_info.get('path')) as img:
-            bg_rgb = hex_to_rgb(background_color)
-
-            if img.mode in ("RGBA", "LA"):
-                background = Image.new("RGB", img.size, bg_rgb)
-                background.paste(img, mask=img.split()[-1])
-                img = background
-            elif img.mode != "RGB":
-                img = img.convert("RGB")
+        # A busca de qualidade codifica a imagem inteira em memória: sem o caminho em faixas
+        if target is None and should_tile_image(image_info, "JPEG"):
+            steps = [('flatten', {'background_color': background_color})]
+            return tiled_image(image_info, steps, format="JPEG", dpi=dpi, quality=quality)
 
+        with Image.open(image_info.get('path')) as img:
+            decode_image(img, image_info.get('path'))
+            with stage('transform', op='flatten'):
+                img = flatten_jpeg_img(img, background_color)
+            if target is not None:
+                return save_searched_image(image_info, img, target, format="JPEG", dpi=dpi)
             return save_new_image(image_info, img, format="JPEG", dpi=dpi, quality=quality)
             
     except FileNotFoundError:
@@ -785,91 +1319,45 @@ def convert_to_jpeg(config):
     image_info['status'] = False
     image_info['error'] = error
 
-    return image_info
-
-def convert_images_to_jpeg(images_info, dpi=None, quality=85, background_color='#FFFFFF'):
-    new_images_info = []
-    old_images_info = []
-    error_images_info = []
-    configs = []
-
-    for image_info in images_info:
-        config = {
-            'image_info': image_info,
-            'background_color': background_color,
-            'dpi': dpi,
-            'quality': quality
-        }
-        configs.append(config)
-
-    with Pool(processes=cpu_count()) as pool:
-        converted_results = pool.map(convert_to_jpeg, configs)
-
-    for new_image_info, old_image_info in converted_results:
-        if new_image_info.get('status'):
-            new_images_info.append(new_image_info)
-            if isinstance(old_image_info, dict):
-                old_images_info.append(old_image_info)
-        else:
-            error_images_info.append(new_image_info)
-
-    return new_images_info, old_images_info, error_images_info
-
-def convert_cv2_to_pil(cv2_img):
-    if len(cv2_img.shape) == 2:
-        return Image.fromarray(cv2_img)
-    elif len(cv2_img.shape) == 3:
-        channels = cv2_img.shape[2]
-
-        if channels == 4:
-            img = cv2.cvtColor(cv2_img, cv2.COLOR_BGRA2RGBA)
-            return Image.fromarray(img)
-        elif channels == 3:
-            img = cv2.cvtColor(cv2_img, cv2.COLOR_BGR2RGB)
-            return Image.fromarray(img)
-        
-    raise ValueError("Formato de imagem desconhecido")
+    return image_info, []
 
-def remove_noise_from_image(image_info):
+def convert_images_to_jpeg(images_info, dpi=None, quality=85, background_color='#FFFFFF', target_kb=None, target_ssim=None):
+    params = {
+        'background_color': background_color,
+        'dpi': dpi,
+        'quality': quality
+    }
+    target = get_search_target(target_kb, target_ssim)
+    if target is not None:
+        params['target'] = target
+    return split_results(map_cached('to_jpeg', convert_to_jpeg, images_info, params))
+
+def remove_noise_img(img, settings):
+    buffer = ImageBuffer.from_pil(img)
+    buffer.array = apply_denoise(buffer.array, settings, buffer.order)
+    return buffer.to_pil()
+
+def remove_noise_from_image(config):
+    image_info = config.get('image_info')
+    settings = config.get('settings')
 
     try:
-        img = cv2.imread(str(image_info.get('path')))
-        if img is None:
+        if should_tile_image(image_info):
+            return tiled_image(image_info, [('remove_noise', settings)])
+
+        # Lido, filtrado e codificado pelo OpenCV no mesmo array BGR(A)/cinza, sem passar pelo Pillow
+        with stage('decode', bytes_read=os.path.getsize(image_info.get('path'))):
+            buffer = read_buffer(image_info.get('path'))
+        if buffer is None:
             image_info['error'] = f"Imagem não pôde ser lida: {image_info.get('path')}"
             image_info['status'] = False
             
             return image_info, []
         
-        # Configurações dos filtros
-        GAUSSIAN_BLUR_ENABLED = True
-        GAUSSIAN_BLUR_KERNEL_SIZE = (5, 5)  # Tamanho do kernel para o desfoque gaussiano
-        GAUSSIAN_BLUR_SIGMA_X = 1.5 #1.2 #4.0 #1.0  # Desvio padrão no eixo X
-        GAUSSIAN_BLUR_SIGMA_Y = 1.5 #1.2 #4.0 #1.0  # Desvio padrão no eixo Y
-
-        BILATERAL_FILTER_ENABLED = True
-        BILATERAL_FILTER_D = 22 #9 #4 #9  # Diâmetro da vizinhança do pixel
-        BILATERAL_FILTER_SIGMA_COLOR = 75 #40 #75  # Filtra o espaço de cores sigma
-        BILATERAL_FILTER_SIGMA_SPACE = 75 #40 #75  # Filtra o espaço coordenado sigma
-
-        MEDIAN_BLUR_ENABLED = False
-        MEDIAN_BLUR_KERNEL_SIZE = 3  # Tamanho do kernel para o desfoque mediano
-
-        SHARPEN_FILTER_ENABLED = True
-        SHARPEN_FILTER_KERNEL = np.array([[-1, -1, -1], [-1,  9, -1], [-1, -1, -1]])  # Kernel para o filtro de nitidez
-
-        if GAUSSIAN_BLUR_ENABLED:
-            img = cv2.GaussianBlur(img, GAUSSIAN_BLUR_KERNEL_SIZE, GAUSSIAN_BLUR_SIGMA_X, GAUSSIAN_BLUR_SIGMA_Y)
+        with stage('transform', op='remove_noise', algorithm=settings.get('algorithm')):
+            buffer.array = apply_denoise(buffer.array, settings, buffer.order)
 
-        if BILATERAL_FILTER_ENABLED:
-            img = cv2.bilateralFilter(img, BILATERAL_FILTER_D, BILATERAL_FILTER_SIGMA_COLOR, BILATERAL_FILTER_SIGMA_SPACE)
-
-        if MEDIAN_BLUR_ENABLED:
-            img = cv2.medianBlur(img, MEDIAN_BLUR_KERNEL_SIZE)
-
-        if SHARPEN_FILTER_ENABLED:
-            img = cv2.filter2D(img, -1, SHARPEN_FILTER_KERNEL)
-
-        return save_new_image(image_info, convert_cv2_to_pil(img))
+        return save_new_image(image_info, buffer)
 
     except FileNotFoundError:
         error = f"Arquivo não encontrado: {image_info.get('path')}"
@@ -889,29 +1377,27 @@ def remove_noise_from_image(image_info):
 
     return image_info, []
 
-def noise_images(images_info):
-    new_images_info = []
-    old_images_info = []
-    error_images_info = []
-
-    with Pool(processes=cpu_count()) as pool:
-        noise_result = pool.map(remove_noise_from_image, images_info)
-
-    for new_image_info, old_image_info in noise_result:
-        if new_image_info.get('status'):
-            new_images_info.append(new_image_info)
-            if isinstance(old_image_info, dict):
-                old_images_info.append(old_image_info)
-        else:
-            error_images_info.append(new_image_info)
-
-    return new_images_info, old_images_info, error_images_info
+def noise_images(images_info, algorithm = None, radius = None, strength = None, scale = None, sharpen = None):
+    params = {'settings': get_denoise_settings(algorithm, radius, strength, scale, sharpen)}
+    return split_results(map_cached('remove_noise', remove_noise_from_image, images_info, params))
 
 def has_alpha(img: Image.Image) -> bool:
     return img.mode in ("RGBA", "LA") or (
         img.mode == "P" and "transparency" in img.info
     )
 
+def prepare_avif_img(img, no_alpha = False, color = None):
+    if not has_alpha(img):
+        return img.convert("RGB")
+    if no_alpha:
+        if color:
+            bg_rgb = hex_to_rgb(color)
+            background = Image.new("RGB", img.size, bg_rgb)
+            background.paste(img, mask=img.split()[-1])
+            return background
+        return img.convert("RGB")
+    return img.convert("RGBA")
+
 def convert_to_avif(config):
     image_info = config.get('image_info')
     no_alpha = config.get('no_alpha')
@@ -920,29 +1406,21 @@ def convert_to_avif(config):
     speed = config.get("speed")
     subsampling = config.get("subsampling")
     color = config.get("color")
+    target = config.get("target")
 
     try:
         with Image.open(image_info.get('path')) as img:
-
-            if not has_alpha(img):
-                img = img.convert("RGB")
-            else:
-                if no_alpha:
-                    if color:
-                        bg_rgb = hex_to_rgb(color)
-                        background = Image.new("RGB", img.size, bg_rgb)
-                        background.paste(img, mask=img.split()[-1])
-                        img = background
-                    else:
-                        img = img.convert("RGB")
-                else:
-                    img = img.convert("RGBA")
+            decode_image(img, image_info.get('path'))
+            with stage('transform', op='prepare_avif'):
+                img = prepare_avif_img(img, no_alpha, color)
 
             extra_args = {
                 'speed': speed,
                 'subsampling': subsampling
             }
 
+            if target is not None:
+                return save_searched_image(image_info, img, target, format="AVIF", dpi=dpi, extra_args=extra_args)
             return save_new_image(image_info, img, format="AVIF", dpi=dpi, quality=quality, extra_args=extra_args)
             
     except FileNotFoundError:
@@ -961,38 +1439,135 @@ def convert_to_avif(config):
     image_info['status'] = False
     image_info['error'] = error
 
-    return image_info
+    return image_info, []
 
-def convert_images_to_avif(images_info, dpi=None, quality=85, no_alpha=False, speed=6, subsampling="4:4:4", color=None):
-    new_images_info = []
-    old_images_info = []
-    error_images_info = []
-    configs = []
+def convert_images_to_avif(images_info, dpi=None, quality=85, no_alpha=False, speed=6, subsampling="4:4:4", color=None, target_kb=None, target_ssim=None):
+    params = {
+        'dpi': dpi,
+        'quality': quality,
+        'no_alpha': no_alpha,
+        'speed': speed,
+        'subsampling': subsampling,
+        'color': color
+    }
+    target = get_search_target(target_kb, target_ssim)
+    if target is not None:
+        params['target'] = target
+    return split_results(map_cached('to_avif', convert_to_avif, images_info, params))
+
+def resize_step(img, save_args, width = None, height = None, dpi = 300, scale = 'mm', exact = False):
+    return resize_img(img, width, height, dpi, scale, exact)
+
+def crop_step(img, save_args, left=0, right=0, top=0, bottom=0, scale='px', type = 'cut', color = None, dpi = 300, threshold = 0, distance = 'rgb', softness = 0):
+    match(type):
+        case 'cut':
+            return cut_border_img(img, left, right, top, bottom, scale, dpi)
+        case 'trim':
+            return trim_img(img)
+        case 'bg':
+            save_args['format'] = 'PNG'
+            return remove_background_img(img, color, threshold, distance, softness)
+    raise ValueError(f'Tipo de recorte não suportado: {type}')
+
+def remove_noise_step(img, save_args, **params):
+    # Mesma orientação da ação avulsa, que lê por read_buffer (aplica o EXIF); depois do transpose a
+    # tag de orientação some, então um segundo remove_noise não gira de novo
+    return remove_noise_img(ImageOps.exif_transpose(img), get_denoise_settings(**params))
+
+def to_jpeg_step(img, save_args, dpi=None, quality=85, background_color='#FFFFFF', target_kb=None, target_ssim=None):
+    save_args.update({'format': 'JPEG', 'dpi': dpi, 'quality': quality, 'extra_args': None, 'target': get_search_target(target_kb, target_ssim)})
+    return flatten_jpeg_img(img, background_color)
+
+def to_avif_step(img, save_args, dpi=None, quality=85, no_alpha=False, speed=6, subsampling="4:4:4", color=None, target_kb=None, target_ssim=None):
+    save_args.update({
+        'format': 'AVIF',
+        'dpi': dpi,
+        'quality': quality,
+        'extra_args': {'speed': speed, 'subsampling': subsampling},
+        'target': get_search_target(target_kb, target_ssim)
+    })
+    return prepare_avif_img(img, no_alpha, color)
+
+# Ações que podem ser enfileiradas no pipeline (mesmos nomes das ações do REPL)
+PIPELINE_STEPS = {
+    'resize': resize_step,
+    'crop': crop_step,
+    'remove_noise': remove_noise_step,
+    'to_jpeg': to_jpeg_step,
+    'to_avif': to_avif_step
+}
+
+def get_tiled_pipeline(steps):
+    # Só resize, crop (cut), remove_noise e to_jpeg (sem busca de qualidade) têm versão em faixas
+    tiled_steps = []
+    save_args = {}
+
+    for step in steps:
+        params = step.get('params', {})
+        match step.get('action'):
+            case 'resize':
+                # exact só escolhe entre draft/reduce na decodificação em memória: o motor em faixas não usa
+                tiled_steps.append(('resize', {key: value for key, value in params.items() if key != 'exact'}))
+            case 'crop' if params.get('type', 'cut') == 'cut':
+                box_params = {key: value for key, value in params.items() if key not in ('type', 'color', 'threshold', 'distance', 'softness')}
+                tiled_steps.append(('crop', box_params))
+            case 'remove_noise':
+                tiled_steps.append(('remove_noise', get_denoise_settings(**params)))
+            case 'to_jpeg' if get_search_target(params.get('target_kb'), params.get('target_ssim')) is None:
+                tiled_steps.append(('flatten', {'background_color': params.get('background_color', '#FFFFFF')}))
+                save_args = {'format': 'JPEG', 'dpi': params.get('dpi'), 'quality': params.get('quality', 85)}
+            case _:
+                return None, None
 
-    for image_info in images_info:
-        config = {
-            'image_info': image_info,
-            'dpi': dpi,
-            'quality': quality,
-            'no_alpha': no_alpha,
-            'speed': speed,
-            'subsampling': subsampling,
-            'color': color
-        }
-        configs.append(config)
+    return tiled_steps, save_args
 
-    with Pool(processes=cpu_count()) as pool:
-        converted_results = pool.map(convert_to_avif, configs)
+def run_pipeline_image(config):
+    image_info = config.get('image_info')
+    steps = config.get('steps')
 
-    for new_image_info, old_image_info in converted_results:
-        if new_image_info.get('status'):
-            new_images_info.append(new_image_info)
-            if isinstance(old_image_info, dict):
-                old_images_info.append(old_image_info)
-        else:
-            error_images_info.append(new_image_info)
+    try:
+        tiled_steps, tiled_save_args = get_tiled_pipeline(steps)
+        if tiled_steps is not None and should_tile_image(image_info, tiled_save_args.get('format')):
+            return tiled_image(image_info, tiled_steps, **tiled_save_args)
 
-    return new_images_info, old_images_info, error_images_info
+        with Image.open(image_info.get('path')) as img:
+            save_args = {}
+            # Decodifica uma vez, aplica todos os passos em memória e codifica só o resultado final.
+            # Sem decode_image aqui: o resize pode pedir draft ao JPEG antes da decodificação
+            with stage('transform', op='pipeline', steps=len(steps)):
+                for step in steps:
+                    img = PIPELINE_STEPS[step.get('action')](img, save_args, **step.get('params', {}))
+
+            target = save_args.pop('target', None)
+            if target is not None:
+                save_args.pop('quality', None)
+                return save_searched_image(image_info, img, target, **save_args)
+            return save_new_image(image_info, img, **save_args)
+
+    except FileNotFoundError:
+        error = f"Arquivo não encontrado: {image_info.get('path')}"
+    except UnidentifiedImageError:
+        error = f"Arquivo não é uma imagem válida: {image_info.get('path')}"
+    except OSError as e:
+        error = f"Falha ao processar imagem '{image_info.get('path')}': {e}"
+    except ValueError as e:
+        error = f"Valor inválido ao salvar '{image_info.get('path')}': {e}"
+    except KeyError as e:
+        error = f"Ação não suportada no pipeline para '{image_info.get('path')}': {e}"
+    except Exception as e:
+        error = f"Erro inesperado com '{image_info.get('path')}': {e}"
+
+    image_info['status'] = False
+    image_info['error'] = error
+
+    return image_info, []
+
+def pipeline_images(images_info, steps, on_result = None):
+    return split_results(map_cached('pipeline', run_pipeline_image, images_info, {'steps': steps}, on_result))
+
+def load_grid_card(image_info):
+    with Image.open(image_info.get('path')) as img:
+        return img.convert("RGB")
 
 def create_grid_image(config):
     images = config.get('images')
@@ -1032,18 +1607,20 @@ def create_grid_image(config):
     guide_rgb = hex_to_rgb(str(guide_color))
     card_border_rgb = hex_to_rgb(str(border_color)) if draw_border else None
 
-    # 1. Colar imagens e bordas
-    for index, image_info in enumerate(images):
-        row = index // cols
-        col = index % cols
+    # 1. Colar imagens e bordas (decodificação das cartas em paralelo; PIL libera o GIL ao decodificar)
+    with ThreadPoolExecutor(max_workers=min(len(images), GRID_DECODE_THREADS)) as executor:
+        cards = executor.map(load_grid_card, images)
 
-        x = margin + (col * cell_w) + padding + effective_border
-        y = margin + (row * cell_h) + padding + effective_border
+        for index, img in enumerate(cards):
+            row = index // cols
+            col = index % cols
+
+            x = margin + (col * cell_w) + padding + effective_border
+            y = margin + (row * cell_h) + padding + effective_border
 
-        with Image.open(image_info.get('path')) as img:
-            img = img.convert("RGB")
             grid_img.paste(img, (int(x), int(y)))
-            
+            img.close()
+
             if draw_border:
                 # O segredo aqui: o retângulo da borda deve envolver a imagem exatamente
                 # bx1 e by1 precisam ser o canto exato onde a imagem termina
@@ -1088,6 +1665,207 @@ def create_grid_image(config):
 
     return grid_img
 
+def create_grid_page(config):
+    base_info = config.get('base_info')
+    output_name = config.get('output_name')
+    ext = config.get('ext')
+
+    try:
+        grid_img = create_grid_image(config)
+
+        new_image_info, old_image_info = save_new_image(base_info, grid_img)
+        new_image_info["name"] = output_name
+        new_image_info["relative_path"] = ensure_path(f"{output_name}{ext}")
+
+        return new_image_info, old_image_info
+
+    except FileNotFoundError as e:
+        error = f"Arquivo não encontrado ao montar '{output_name}': {e}"
+    except UnidentifiedImageError as e:
+        error = f"Arquivo não é uma imagem válida ao montar '{output_name}': {e}"
+    except OSError as e:
+        error = f"Falha ao montar grid '{output_name}': {e}"
+    except Exception as e:
+        error = f"Erro inesperado ao montar grid '{output_name}': {e}"
+
+    base_info['status'] = False
+    base_info['error'] = error
+
+    return base_info, None
+
+def prepare_pdf_image(config):
+    image_info = config.get('image_info')
+
+    try:
+        with Image.open(image_info.get('path')) as img:
+            payload = {
+                'width': img.width,
+                'height': img.height,
+                'dpi': img.info.get('dpi', (None, None))[0],
+                'alpha': None
+            }
+
+            if img.format == 'JPEG' and img.mode in ("RGB", "L"):
+                # JPEG entra no PDF como está (DCTDecode), sem decodificar nem recomprimir
+                with open(image_info.get('path'), 'rb') as file:
+                    payload['data'] = file.read()
+                payload['filter'] = 'DCTDecode'
+                payload['color_space'] = 'DeviceRGB' if img.mode == "RGB" else 'DeviceGray'
+            else:
+                if has_alpha(img):
+                    img = img.convert("RGBA")
+                    payload['alpha'] = zlib.compress(img.getchannel("A").tobytes())
+                img = img.convert("RGB")
+                payload['data'] = zlib.compress(img.tobytes())
+                payload['filter'] = 'FlateDecode'
+                payload['color_space'] = 'DeviceRGB'
+
+            payload['digest'] = digest_bytes(payload['data'])
+            image_info['status'] = True
+            return image_info, payload
+
+    except FileNotFoundError:
+        error = f"Arquivo não encontrado: {image_info.get('path')}"
+    except UnidentifiedImageError:
+        error = f"Arquivo não é uma imagem válida: {image_info.get('path')}"
+    except OSError as e:
+        error = f"Falha ao processar imagem '{image_info.get('path')}': {e}"
+    except Exception as e:
+        error = f"Erro inesperado com '{image_info.get('path')}': {e}"
+
+    image_info['status'] = False
+    image_info['error'] = error
+
+    return image_info, None
+
+def pdf_color(hex_color):
+    return ' '.join(pdf_number(channel / 255) for channel in hex_to_rgb(str(hex_color)))
+
+def grid_guides_ops(config, total_images, used_rows, cell_w, cell_h, to_pt_x, to_pt_y, scale):
+    cols = config.get('cols')
+    margin = config.get('margin')
+    guide_size = config.get('guide_size')
+    guide_extend = config.get('guide_extend')
+    guide_outward_size = config.get('guide_outward_size')
+    guide_thickness = config.get('guide_thickness')
+    # Mesmo desenho de create_grid_image; o traço centraliza onde o PIL pintaria a linha
+    offset = (guide_thickness % 2) / 2
+    ops = [f'{pdf_color(config.get("guide_color"))} RG {pdf_number(guide_thickness * scale)} w 0 J\n']
+
+    for r in range(used_rows + 1):
+        for c in range(cols + 1):
+            cx = margin + (c * cell_w)
+            cy = margin + (r * cell_h)
+
+            if r == used_rows and c > (total_images % cols) and (total_images % cols) != 0:
+                continue
+
+            is_top = (r == 0)
+            is_bottom = (r == used_rows)
+            is_left = (c == 0)
+            is_right = (c == cols)
+
+            v_start = cy - (guide_outward_size if (is_top and guide_extend) else (0 if is_top else guide_size))
+            v_end = cy + (guide_outward_size if (is_bottom and guide_extend) else (0 if is_bottom else guide_size))
+            if v_start != v_end:
+                ops.append(
+                    f'{pdf_number(to_pt_x(cx + offset))} {pdf_number(to_pt_y(v_start))} m '
+                    f'{pdf_number(to_pt_x(cx + offset))} {pdf_number(to_pt_y(v_end + 1))} l S\n'
+                )
+
+            h_start = cx - (guide_outward_size if (is_left and guide_extend) else (0 if is_left else guide_size))
+            h_end = cx + (guide_outward_size if (is_right and guide_extend) else (0 if is_right else guide_size))
+            if h_start != h_end:
+                ops.append(
+                    f'{pdf_number(to_pt_x(h_start))} {pdf_number(to_pt_y(cy + offset))} m '
+                    f'{pdf_number(to_pt_x(h_end + 1))} {pdf_number(to_pt_y(cy + offset))} l S\n'
+                )
+
+    return ''.join(ops)
+
+def write_grid_pdf_page(pdf, config, cards, dpi):
+    cols = config.get('cols')
+    padding = config.get('padding')
+    margin = config.get('margin')
+    draw_border = config.get('draw_border')
+    border_thickness = config.get('border_thickness')
+
+    # Mesmas medidas em px de create_grid_image, convertidas para pontos pelo DPI
+    img_w, img_h = cards[0][1], cards[0][2]
+    used_rows = math.ceil(len(cards) / cols)
+    effective_border = border_thickness if draw_border else 0
+    cell_w = img_w + (padding * 2) + (effective_border * 2)
+    cell_h = img_h + (padding * 2) + (effective_border * 2)
+    grid_w = (cols * cell_w) + (margin * 2)
+    grid_h = (used_rows * cell_h) + (margin * 2)
+
+    scale = 72 / dpi
+    page_h = grid_h * scale
+    to_pt_x = lambda x: x * scale
+    to_pt_y = lambda y: page_h - y * scale
+
+    ops = []
+    images = {}
+    for index, (image_id, width, height) in enumerate(cards):
+        row = index // cols
+        col = index % cols
+        x = margin + (col * cell_w) + padding + effective_border
+        y = margin + (row * cell_h) + padding + effective_border
+
+        name = f'Im{index}'
+        images[name] = image_id
+        ops.append(draw_image_op(name, to_pt_x(x), to_pt_y(y + height), width * scale, height * scale))
+
+        if draw_border:
+            inset = effective_border / 2
+            ops.append(
+                f'{pdf_color(config.get("border_color"))} RG {pdf_number(border_thickness * scale)} w '
+                f'{pdf_number(to_pt_x(x - inset))} {pdf_number(to_pt_y(y + img_h + inset))} '
+                f'{pdf_number((img_w + effective_border) * scale)} {pdf_number((img_h + effective_border) * scale)} re S\n'
+            )
+
+    if config.get('draw_guides'):
+        ops.append(grid_guides_ops(config, len(cards), used_rows, cell_w, cell_h, to_pt_x, to_pt_y, scale))
+
+    pdf.add_page(grid_w * scale, page_h, ''.join(ops), images)
+
+def images_to_grid_pdf(images_info, per_page, config, output_directory_path, file_name, dpi):
+    success_images_info = []
+    error_images_info = []
+    # Cada carta vira um único XObject (por conteúdo), mesmo que se repita em várias folhas
+    image_ids = {}
+    page_cards = []
+
+    output_directory_path = ensure_path(output_directory_path)
+    output_pdf_path = output_directory_path / f'{file_name}.pdf'
+    configs = ({'image_info': image_info} for image_info in images_info)
+
+    with PdfStreamWriter(output_pdf_path) as pdf:
+        for image_info, payload in imap_bounded(prepare_pdf_image, configs):
+            if not image_info.get('status'):
+                error_images_info.append(image_info)
+                continue
+
+            dpi = dpi or payload.get('dpi') or 300
+            digest = payload['digest']
+            if digest not in image_ids:
+                image_ids[digest] = pdf.add_image(
+                    payload['data'], payload['width'], payload['height'],
+                    payload['color_space'], payload['filter'], payload['alpha']
+                )
+
+            page_cards.append((image_ids[digest], payload['width'], payload['height']))
+            success_images_info.append(image_info)
+
+            if len(page_cards) == per_page:
+                write_grid_pdf_page(pdf, config, page_cards, dpi)
+                page_cards = []
+
+        if page_cards:
+            write_grid_pdf_page(pdf, config, page_cards, dpi)
+
+    return success_images_info, [], error_images_info
+
 def images_to_grid(images_info, rows=3, cols=3,
                    no_guides=False,
                    guide_color='#757575',
@@ -1100,7 +1878,10 @@ def images_to_grid(images_info, rows=3, cols=3,
                    border_thickness=5,
                    padding=0,
                    margin=0,
-                   file_name="grid"):
+                   file_name="grid",
+                   output='image',
+                   output_directory_path='.',
+                   dpi=None):
 
     draw_guides = False if no_guides else True
     if guide_extend and margin < guide_outward_size:
@@ -1108,19 +1889,13 @@ def images_to_grid(images_info, rows=3, cols=3,
 
     new_images_info = []
     old_images_info = []
+    error_images_info = []
 
     per_page = rows * cols
 
-    chunks = [
-        images_info[i:i + per_page]
-        for i in range(0, len(images_info), per_page)
-    ]
-
-    for i, chunk in enumerate(chunks, start=1):
-        output_name = f"{file_name}_{i}"
-
+    if output == 'pdf':
+        # Imposição vetorial: cartas embutidas na resolução nativa, guias e bordas como traços
         config = {
-            'images': chunk,
             'cols': cols,
             'draw_guides': draw_guides,
             'guide_color': guide_color,
@@ -1134,26 +1909,55 @@ def images_to_grid(images_info, rows=3, cols=3,
             'padding': padding,
             'margin': margin
         }
+        return images_to_grid_pdf(images_info, per_page, config, output_directory_path, file_name, dpi)
+
+    chunks = [
+        images_info[i:i + per_page]
+        for i in range(0, len(images_info), per_page)
+    ]
+
+    configs = []
+    for i, chunk in enumerate(chunks, start=1):
+        output_name = f"{file_name}_{i}"
 
         base_info = chunk[0].copy()
-        
+
         orig_path = base_info.get("external_source_path") or base_info.get("path")
         ext = ensure_path(orig_path).suffix if orig_path else ".avif"
         base_info["relative_path"] = ensure_path(f"{output_name}{ext}")
         base_info["external_source_path"] = ensure_path(f"/{output_name}{ext}")
 
-        grid_img = create_grid_image(config)
-        
-        new_image_info, old_image_info = save_new_image(base_info, grid_img)
-        new_image_info["name"] = output_name
-        new_image_info["relative_path"] = ensure_path(f"{output_name}{ext}")
+        configs.append({
+            'base_info': base_info,
+            'output_name': output_name,
+            'ext': ext,
+            'images': chunk,
+            'cols': cols,
+            'draw_guides': draw_guides,
+            'guide_color': guide_color,
+            'guide_thickness': guide_thickness,
+            'guide_size': guide_size,
+            'guide_extend': guide_extend,
+            'guide_outward_size': guide_outward_size,
+            'draw_border': draw_border,
+            'border_color': border_color,
+            'border_thickness': border_thickness,
+            'padding': padding,
+            'margin': margin
+        })
 
-        new_images_info.append(new_image_info)
+    # Uma página por tarefa; pool.map mantém a ordem das folhas
+    grid_results = map_traced('to_grid', create_grid_page, configs, chunksize=1)
 
-        if old_image_info:
-            old_images_info.append(old_image_info)
+    for new_image_info, old_image_info in grid_results:
+        if new_image_info.get('status'):
+            new_images_info.append(new_image_info)
+            if old_image_info:
+                old_images_info.append(old_image_info)
+        else:
+            error_images_info.append(new_image_info)
 
-    return new_images_info, old_images_info, []
+    return new_images_info, old_images_info, error_images_info
 
 # --action from_grid --rows 3 --cols 3
 
@@ -0,0 +1,305 @@
+import json
+import os
+import sqlite3
+import threading
+import time
+from pathlib import Path
+from debug_log import print_log
+from image_record import ImageRecord
+from session import get_session_images_path, get_session_path
+
+# Manifesto da sessão: um SQLite (WAL) por sessão com todos os registros de imagem e a linhagem (old_id).
+# Workers gravam cada imagem nova ao salvar; o processo principal marca o conjunto de trabalho
+# (state = 'current'/'error', na ordem de seq) ao fim de cada ação. Retomar = uma consulta indexada.
+
+MANIFEST_FILE_NAME = "manifest.sqlite"
+GC_ENABLED = True
+GC_KEEP_GENERATIONS = 3  # conjunto atual + 2 anteriores para --action undo
+GC_MAX_BYTES = None  # orçamento de disco da pasta de imagens da sessão (None = sem limite)
+RECORD_COLUMNS = ['id', 'old_id', 'path', 'external_source_path', 'relative_path', 'status', 'error']
+
+SCHEMA = '''
+CREATE TABLE IF NOT EXISTS images (
+    id TEXT PRIMARY KEY,
+    old_id TEXT,
+    path TEXT,
+    external_source_path TEXT,
+    relative_path TEXT,
+    status INTEGER,
+    error TEXT,
+    extra TEXT,
+    state TEXT NOT NULL DEFAULT 'new',
+    seq INTEGER,
+    deleted INTEGER NOT NULL DEFAULT 0
+);
+CREATE INDEX IF NOT EXISTS images_state ON images (state, seq);
+CREATE INDEX IF NOT EXISTS images_old_id ON images (old_id);
+CREATE TABLE IF NOT EXISTS generations (
+    generation INTEGER PRIMARY KEY AUTOINCREMENT,
+    created REAL
+);
+CREATE TABLE IF NOT EXISTS generation_images (
+    generation INTEGER,
+    seq INTEGER,
+    id TEXT,
+    PRIMARY KEY (generation, seq)
+);
+CREATE INDEX IF NOT EXISTS generation_images_id ON generation_images (id);
+'''
+
+UPSERT = f'''
+INSERT INTO images ({', '.join(RECORD_COLUMNS)}, extra, state, seq) VALUES ({', '.join('?' * (len(RECORD_COLUMNS) + 3))})
+ON CONFLICT (id) DO UPDATE SET
+    {', '.join(f'{column} = excluded.{column}' for column in RECORD_COLUMNS[1:])},
+    extra = excluded.extra,
+    state = CASE WHEN excluded.state = 'new' THEN images.state ELSE excluded.state END,
+    seq = CASE WHEN excluded.state = 'new' THEN images.seq ELSE excluded.seq END
+'''
+
+# Uma conexão por thread (sqlite3 não compartilha entre threads) e por processo (a do pai não serve
+# depois do fork), sempre da última sessão usada por aquela thread
+local = threading.local()
+
+def get_manifest_path(session_id):
+    return get_session_path(session_id) / MANIFEST_FILE_NAME
+
+def has_manifest(session_id):
+    return bool(session_id) and get_manifest_path(session_id).is_file()
+
+def get_connection(session_id):
+    state = getattr(local, 'state', None)
+    if state is not None and state[0] == os.getpid():
+        if state[1] == session_id:
+            return state[2]
+        state[2].close()
+
+    get_session_path(session_id).mkdir(parents=True, exist_ok=True)
+    connection = sqlite3.connect(get_manifest_path(session_id), timeout=30, isolation_level=None)
+    # WAL: leitores não bloqueiam os workers; NORMAL só sincroniza no checkpoint
+    connection.execute('PRAGMA journal_mode = WAL')
+    connection.execute('PRAGMA synchronous = NORMAL')
+    connection.executescript(SCHEMA)
+    if 'deleted' not in [column[1] for column in connection.execute('PRAGMA table_info(images)')]:
+        # Manifesto anterior ao GC
+        connection.execute('ALTER TABLE images ADD COLUMN deleted INTEGER NOT NULL DEFAULT 0')
+
+    local.state = (os.getpid(), session_id, connection)
+    return connection
+
+def to_row(image_info, state = 'new', seq = None):
+    # ImageRecord: valores crus (caminhos ainda em texto não viram Path só para voltar a texto) e
+    # as chaves extras já separadas dos campos fixos
+    if isinstance(image_info, ImageRecord):
+        get = image_info.raw
+        extra = image_info.extra
+    else:
+        get = image_info.get
+        extra = {key: value for key, value in image_info.items() if key not in RECORD_COLUMNS and key != 'session_id'}
+
+    row = []
+    for column in RECORD_COLUMNS:
+        value = get(column)
+        if column == 'status' and value is not None:
+            value = int(bool(value))
+        row.append(str(value) if isinstance(value, Path) else value)
+
+    row.append(json.dumps(extra, default=str) if extra else None)
+    row.append(state)
+    row.append(seq)
+    return row
+
+def from_row(session_id, row):
+    # Desempacotamento direto: na retomada isto roda uma vez por imagem da sessão.
+    # Caminhos ficam em texto até o primeiro acesso (ImageRecord converte sob demanda)
+    image_id, old_id, path, external_source_path, relative_path, status, error, extra = row
+    image_info = ImageRecord(
+        external_source_path=external_source_path,
+        relative_path=relative_path,
+        id=image_id,
+        session_id=session_id,
+        path=path
+    )
+    if status is not None:
+        image_info['status'] = bool(status)
+    if error is not None:
+        image_info['error'] = error
+    if old_id is not None:
+        image_info['old_id'] = old_id
+
+    if extra:
+        for key, value in json.loads(extra).items():
+            image_info[key] = Path(value) if key.endswith('_path') and isinstance(value, str) else value
+
+    return image_info
+
+def write_records(session_id, images_info, state = 'new'):
+    # Uma transação por chamada; state 'new' não mexe no conjunto de trabalho
+    images_info = [image_info for image_info in images_info if image_info.get('id') is not None]
+    if not session_id or not images_info:
+        return
+
+    connection = get_connection(session_id)
+    with connection:
+        connection.execute('BEGIN')
+        connection.executemany(UPSERT, [to_row(image_info, state) for image_info in images_info])
+
+def record_images(images_info):
+    by_session = {}
+    for image_info in images_info:
+        by_session.setdefault(image_info.get('session_id'), []).append(image_info)
+    for session_id, session_images_info in by_session.items():
+        write_records(session_id, session_images_info)
+
+def record_image(image_info):
+    write_records(image_info.get('session_id'), [image_info])
+
+def get_generations(connection, limit = -1):
+    return [generation for (generation,) in connection.execute('SELECT generation FROM generations ORDER BY generation DESC LIMIT ?', (limit,))]
+
+def get_generation_ids(connection, generation):
+    return [image_id for (image_id,) in connection.execute('SELECT id FROM generation_images WHERE generation = ? ORDER BY seq', (generation,))]
+
+def set_working_set(session_id, images_info, error_images_info = None):
+    # Troca o conjunto de trabalho atomicamente: quem era current/error vira 'old'.
+    # Cada conjunto diferente do anterior vira uma geração nova (base do GC e do undo)
+    if not session_id:
+        return
+
+    connection = get_connection(session_id)
+    rows = [to_row(image_info, 'current', seq) for seq, image_info in enumerate(images_info) if image_info.get('id') is not None]
+    rows += [to_row(image_info, 'error', seq) for seq, image_info in enumerate(error_images_info or []) if image_info.get('id') is not None]
+    ids = [image_info.get('id') for image_info in images_info if image_info.get('id') is not None]
+
+    with connection:
+        connection.execute('BEGIN IMMEDIATE')
+        connection.execute("UPDATE images SET state = 'old', seq = NULL WHERE state IN ('current', 'error')")
+        connection.executemany(UPSERT, rows)
+
+        latest = get_generations(connection, 1)
+        if not latest or get_generation_ids(connection, latest[0]) != ids:
+            generation = connection.execute('INSERT INTO generations (created) VALUES (?)', (time.time(),)).lastrowid
+            connection.executemany(
+                'INSERT INTO generation_images (generation, seq, id) VALUES (?, ?, ?)',
+                [(generation, seq, image_id) for seq, image_id in enumerate(ids)]
+            )
+
+def undo_working_set(session_id):
+    # Descarta a geração atual e devolve a anterior (None se não houver)
+    connection = get_connection(session_id)
+    generations = get_generations(connection, 2)
+    if len(generations) < 2:
+        return None
+
+    with connection:
+        connection.execute('BEGIN IMMEDIATE')
+        connection.execute('DELETE FROM generation_images WHERE generation = ?', (generations[0],))
+        connection.execute('DELETE FROM generations WHERE generation = ?', (generations[0],))
+
+    columns = ', '.join(f'images.{column}' for column in RECORD_COLUMNS + ['extra'])
+    return [
+        from_row(session_id, row)
+        for row in connection.execute(
+            f'SELECT {columns} FROM generation_images JOIN images ON images.id = generation_images.id '
+            f'WHERE generation_images.generation = ? ORDER BY generation_images.seq',
+            (generations[1],)
+        )
+    ]
+
+def get_file_size(path):
+    try:
+        return os.stat(path).st_size
+    except OSError:
+        return 0
+
+def collect_garbage(session_id, keep = None, max_bytes = None):
+    # Apaga arquivos de registros que nenhuma das últimas `keep` gerações alcança; com orçamento,
+    # descarta gerações antigas (nunca a atual) até caber. Só remove arquivos da pasta de imagens da sessão
+    keep = max(1, GC_KEEP_GENERATIONS if keep is None else keep)
+    max_bytes = GC_MAX_BYTES if max_bytes is None else max_bytes
+    connection = get_connection(session_id)
+    images_folder_path = get_session_images_path(session_id).resolve()
+
+    records = {
+        image_id: path
+        for image_id, path in connection.execute('SELECT id, path FROM images WHERE deleted = 0 AND path IS NOT NULL')
+    }
+    # Conjunto atual e registros com erro nunca são coletados, com ou sem gerações registradas
+    pinned = {image_id for (image_id,) in connection.execute("SELECT id FROM images WHERE state IN ('current', 'error')")}
+    generations = get_generations(connection)
+    members = {generation: set(get_generation_ids(connection, generation)) for generation in generations[:keep]}
+    kept = generations[:keep]
+
+    def reachable_paths(kept_generations):
+        reachable = set(pinned).union(*(members[generation] for generation in kept_generations))
+        return {records[image_id] for image_id in reachable if image_id in records}
+
+    sizes = {path: get_file_size(path) for path in set(records.values())}
+    live_paths = reachable_paths(kept)
+    while max_bytes is not None and len(kept) > 1 and sum(sizes[path] for path in live_paths) > max_bytes:
+        kept = kept[:-1]
+        live_paths = reachable_paths(kept)
+
+    deleted_ids = []
+    reclaimed = 0
+    for image_id, path in records.items():
+        if path in live_paths:
+            continue
+        resolved = Path(path).resolve()
+        if not resolved.is_relative_to(images_folder_path):
+            # Origem externa (ex.: referência sem cópia): nunca é apagada
+            continue
+        try:
+            resolved.unlink()
+            reclaimed += sizes[path]
+        except FileNotFoundError:
+            pass
+        except OSError as e:
+            print_log(f"Falha ao apagar '{path}': {e}", type='warning', level=2)
+            continue
+        deleted_ids.append(image_id)
+
+    with connection:
+        connection.execute('BEGIN IMMEDIATE')
+        connection.executemany('UPDATE images SET deleted = 1 WHERE id = ?', [(image_id,) for image_id in deleted_ids])
+        if kept:
+            connection.execute('DELETE FROM generation_images WHERE generation < ?', (kept[-1],))
+            connection.execute('DELETE FROM generations WHERE generation < ?', (kept[-1],))
+
+    return {
+        'files': len(deleted_ids),
+        'bytes_reclaimed': reclaimed,
+        'bytes_in_use': sum(sizes[path] for path in live_paths),
+        'generations_kept': len(kept)
+    }
+
+def load_working_set(session_id):
+    connection = get_connection(session_id)
+    columns = ', '.join(RECORD_COLUMNS + ['extra'])
+    images_info = [
+        from_row(session_id, row)
+        for row in connection.execute(f"SELECT {columns} FROM images WHERE state = 'current' ORDER BY seq")
+    ]
+    error_images_info = [
+        from_row(session_id, row)
+        for row in connection.execute(f"SELECT {columns} FROM images WHERE state = 'error' ORDER BY seq")
+    ]
+    return images_info, error_images_info
+
+def get_lineage(session_id, image_id):
+    # Do registro pedido até a importação original, seguindo old_id
+    connection = get_connection(session_id)
+    lineage = []
+    columns = ', '.join(RECORD_COLUMNS + ['extra'])
+    while image_id is not None:
+        row = connection.execute(f'SELECT {columns} FROM images WHERE id = ?', (image_id,)).fetchone()
+        if row is None:
+            break
+        image_info = from_row(session_id, row)
+        lineage.append(image_info)
+        image_id = image_info.get('old_id')
+    return lineage
+
+def get_manifest_summary(session_id):
+    connection = get_connection(session_id)
+    counts = dict(connection.execute('SELECT state, COUNT(*) FROM images GROUP BY state').fetchall())
+    return {'session_id': session_id, 'records': sum(counts.values())} | counts
@@ -0,0 +1,179 @@
+import itertools
+import json
+import os
+import resource
+import sys
+import threading
+import time
+from contextlib import contextmanager
+from functools import partial
+import numpy as np
+from session import TEMP_DATA_FOLDER_PATH
+
+# Instrumentação por etapa: cada processo anexa eventos (um JSON por linha) em
+# metrics/<pid da execução>/<pid>.jsonl, então workers da pool não precisam devolver nada ao
+# processo principal. Uma pasta por execução: limpar ou ler as métricas não mexe em outra execução
+# rodando ao mesmo tempo.
+
+METRICS_FOLDER_PATH = TEMP_DATA_FOLDER_PATH / "metrics"
+# Workers herdam (fork) ou recebem pelo initializer da pool (spawn) a pasta do processo principal
+METRICS_RUN_PATH = METRICS_FOLDER_PATH / str(os.getpid())
+METRICS_ENABLED = True
+
+events_lock = threading.Lock()
+dispatch_ids = itertools.count()
+local = threading.local()
+
+def peak_rss_mb():
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # ru_maxrss é KB no Linux e bytes no macOS
+    return round(peak / (1024 ** 2 if sys.platform == 'darwin' else 1024), 1)
+
+def write_event(event):
+    line = json.dumps(event, default=str) + '\n'
+    path = METRICS_RUN_PATH / f'{os.getpid()}.jsonl'
+
+    # Abre e fecha a cada evento: sobrevive a clear_temp e a fork sem buffers herdados
+    with events_lock:
+        try:
+            with open(path, 'a') as file:
+                file.write(line)
+        except FileNotFoundError:
+            METRICS_RUN_PATH.mkdir(parents=True, exist_ok=True)
+            with open(path, 'a') as file:
+                file.write(line)
+
+@contextmanager
+def stage(name, cat = 'stage', **args):
+    # Quem chama pode completar o evento (bytes lidos/escritos etc.) pelo dicionário retornado
+    if not METRICS_ENABLED:
+        yield args
+        return
+
+    start_ns = time.time_ns()
+    start = time.perf_counter_ns()
+    # CPU da thread atual: threads auxiliares (ex.: decodificação do grid) medem a própria etapa
+    start_cpu = time.thread_time_ns()
+    try:
+        yield args
+    finally:
+        write_event({
+            'name': name,
+            'cat': cat,
+            'pid': os.getpid(),
+            'tid': threading.get_ident(),
+            'ts': start_ns // 1000,
+            'dur': (time.perf_counter_ns() - start) // 1000,
+            'cpu': (time.thread_time_ns() - start_cpu) // 1000,
+            'peak_rss_mb': peak_rss_mb(),
+            'args': args
+        })
+
+def run_traced(name, dispatch, func, item):
+    with stage(name, cat='task', dispatch=dispatch):
+        return func(item)
+
+def traced(name, func):
+    # Envolve a função enviada à pool; o id liga cada tarefa ao despacho que a originou
+    dispatch = f'{os.getpid()}-{next(dispatch_ids)}'
+    return partial(run_traced, name, dispatch, func), dispatch
+
+def load_events():
+    events = []
+    if not METRICS_RUN_PATH.is_dir():
+        return events
+
+    for path in METRICS_RUN_PATH.glob('*.jsonl'):
+        with open(path) as file:
+            for line in file:
+                try:
+                    events.append(json.loads(line))
+                except json.JSONDecodeError:
+                    # Linha cortada de um worker encerrado no meio da escrita
+                    continue
+
+    events.sort(key=lambda event: event.get('ts'))
+    return events
+
+def get_dispatch_overheads(events):
+    # Tempo do despacho que não é trabalho: pickle, fila e espera pelo worker mais carregado
+    busy = {}
+    for event in events:
+        dispatch = event.get('args', {}).get('dispatch')
+        if event.get('cat') == 'task' and dispatch is not None:
+            per_worker = busy.setdefault(dispatch, {})
+            # Por processo e thread: com o executor de threads, todas as tarefas têm o mesmo pid
+            worker = (event.get('pid'), event.get('tid'))
+            per_worker[worker] = per_worker.get(worker, 0) + event.get('dur')
+
+    overheads = {}
+    for event in events:
+        if event.get('cat') != 'dispatch':
+            continue
+        per_worker = busy.get(event.get('args', {}).get('id'), {})
+        critical_path = max(per_worker.values(), default=0)
+        overheads.setdefault(event.get('name'), []).append(max(event.get('dur') - critical_path, 0))
+
+    return overheads
+
+def get_stats(events = None):
+    events = load_events() if events is None else events
+    groups = {}
+    for event in events:
+        groups.setdefault((event.get('cat'), event.get('name')), []).append(event)
+
+    overheads = get_dispatch_overheads(events)
+    stats = []
+    for (cat, name), group in groups.items():
+        durations = np.array([event.get('dur') for event in group]) / 1000
+        summary = {
+            'cat': cat,
+            'name': name,
+            'count': len(group),
+            'total_ms': round(float(durations.sum()), 2),
+            'mean_ms': round(float(durations.mean()), 2),
+            'p95_ms': round(float(np.percentile(durations, 95)), 2),
+            'cpu_ms': round(sum(event.get('cpu') for event in group) / 1000, 2),
+            'bytes_read': sum(event.get('args', {}).get('bytes_read', 0) for event in group),
+            'bytes_written': sum(event.get('args', {}).get('bytes_written', 0) for event in group),
+            'peak_rss_mb': max(event.get('peak_rss_mb', 0) for event in group)
+        }
+        if cat == 'dispatch':
+            summary['overhead_ms'] = round(sum(overheads.get(name, [])) / 1000, 2)
+        stats.append(summary)
+
+    stats.sort(key=lambda summary: summary.get('total_ms'), reverse=True)
+    return stats
+
+def export_events(path, events = None):
+    events = load_events() if events is None else events
+    path.parent.mkdir(parents=True, exist_ok=True)
+
+    with open(path, 'w') as file:
+        if path.suffix == '.jsonl':
+            for event in events:
+                file.write(json.dumps(event, default=str) + '\n')
+        else:
+            # Formato Chrome trace (chrome://tracing, Perfetto): eventos completos "X" em µs
+            trace = [
+                {
+                    'name': event.get('name'),
+                    'cat': event.get('cat'),
+                    'ph': 'X',
+                    'ts': event.get('ts'),
+                    'dur': event.get('dur'),
+                    'pid': event.get('pid'),
+                    'tid': event.get('tid'),
+                    'args': event.get('args', {}) | {'cpu_us': event.get('cpu'), 'peak_rss_mb': event.get('peak_rss_mb')}
+                }
+                for event in events
+            ]
+            json.dump({'traceEvents': trace, 'displayTimeUnit': 'ms'}, file, default=str)
+
+    return path
+
+def clear_metrics():
+    # Só a pasta desta execução; as de execuções anteriores saem com clear_temp
+    if METRICS_RUN_PATH.is_dir():
+        for path in METRICS_RUN_PATH.glob('*.jsonl'):
+            path.unlink(missing_ok=True)
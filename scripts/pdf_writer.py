@@ -0,0 +1,114 @@
+import os
+import zlib
+
+# Escritor de PDF mínimo e sequencial: cada objeto vai direto para o arquivo,
+# só os offsets (inteiros) ficam em memória, então o consumo não cresce com o número de páginas.
+# Escreve em <path>.tmp e só troca para o caminho final depois do xref/trailer: uma falha no meio
+# não deixa um PDF truncado com cara de exportação pronta.
+
+CATALOG_ID = 1
+PAGES_ID = 2
+
+def pdf_number(value):
+    if isinstance(value, int):
+        return str(value)
+    return f'{value:.4f}'.rstrip('0').rstrip('.')
+
+class PdfStreamWriter:
+    def __init__(self, path):
+        self.path = path
+        self.tmp_path = f'{path}.tmp'
+        self.file = open(self.tmp_path, 'wb')
+        self.offsets = [0, 0, 0]
+        self.page_ids = []
+        self.file.write(b'%PDF-1.4\n%\xe2\xe3\xcf\xd3\n')
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, traceback):
+        if exc_type is not None:
+            self.discard()
+            return
+        try:
+            self.close()
+        except BaseException:
+            self.discard()
+            raise
+
+    def discard(self):
+        self.file.close()
+        try:
+            os.remove(self.tmp_path)
+        except FileNotFoundError:
+            pass
+
+    def new_object_id(self):
+        self.offsets.append(0)
+        return len(self.offsets) - 1
+
+    def write_object(self, object_id, dictionary, stream = None):
+        self.offsets[object_id] = self.file.tell()
+        if stream is not None:
+            dictionary = f'{dictionary[:-2]} /Length {len(stream)} >>'
+        self.file.write(f'{object_id} 0 obj\n{dictionary}\n'.encode())
+        if stream is not None:
+            self.file.write(b'stream\n')
+            self.file.write(stream)
+            self.file.write(b'\nendstream\n')
+        self.file.write(b'endobj\n')
+
+    def add_image(self, data, width, height, color_space = 'DeviceRGB', filter = 'DCTDecode', alpha = None):
+        # data já codificado (JPEG para DCTDecode, zlib para FlateDecode); alpha é um plano DeviceGray em zlib
+        smask = ''
+        if alpha is not None:
+            smask_id = self.new_object_id()
+            self.write_object(
+                smask_id,
+                f'<< /Type /XObject /Subtype /Image /Width {width} /Height {height} '
+                f'/ColorSpace /DeviceGray /BitsPerComponent 8 /Filter /FlateDecode >>',
+                alpha
+            )
+            smask = f' /SMask {smask_id} 0 R'
+
+        image_id = self.new_object_id()
+        self.write_object(
+            image_id,
+            f'<< /Type /XObject /Subtype /Image /Width {width} /Height {height} '
+            f'/ColorSpace /{color_space} /BitsPerComponent 8 /Filter /{filter}{smask} >>',
+            data
+        )
+        return image_id
+
+    def add_page(self, width, height, content, images = None):
+        images = images or {}
+        content_id = self.new_object_id()
+        self.write_object(content_id, '<< /Filter /FlateDecode >>', zlib.compress(content.encode()))
+
+        xobjects = ' '.join(f'/{name} {image_id} 0 R' for name, image_id in images.items())
+        page_id = self.new_object_id()
+        self.write_object(
+            page_id,
+            f'<< /Type /Page /Parent {PAGES_ID} 0 R /MediaBox [0 0 {pdf_number(width)} {pdf_number(height)}] '
+            f'/Resources << /XObject << {xobjects} >> >> /Contents {content_id} 0 R >>'
+        )
+        self.page_ids.append(page_id)
+        return page_id
+
+    def close(self):
+        kids = ' '.join(f'{page_id} 0 R' for page_id in self.page_ids)
+        self.write_object(PAGES_ID, f'<< /Type /Pages /Kids [{kids}] /Count {len(self.page_ids)} >>')
+        self.write_object(CATALOG_ID, f'<< /Type /Catalog /Pages {PAGES_ID} 0 R >>')
+
+        xref_offset = self.file.tell()
+        self.file.write(f'xref\n0 {len(self.offsets)}\n0000000000 65535 f \n'.encode())
+        for offset in self.offsets[1:]:
+            self.file.write(f'{offset:010d} 00000 n \n'.encode())
+        self.file.write(
+            f'trailer\n<< /Size {len(self.offsets)} /Root {CATALOG_ID} 0 R >>\nstartxref\n{xref_offset}\n%%EOF\n'.encode()
+        )
+        self.file.close()
+        os.replace(self.tmp_path, self.path)
+
+def draw_image_op(name, x, y, width, height):
+    return f'q {pdf_number(width)} 0 0 {pdf_number(height)} {pdf_number(x)} {pdf_number(y)} cm /{name} Do Q\n'
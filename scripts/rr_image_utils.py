@@ -1,9 +1,48 @@
 import shlex
+import shutil
 import sys
+import time
+import cache
+import manifest
+import metrics
+import workers
+from concurrent.futures import ThreadPoolExecutor
 from input_parser import parse_args
+from batch import as_path_list, format_step, get_batch_jobs, get_batch_steps, get_job_name, load_batch_file, validate_batch
 from debug_log import print_log
-from image_utils import convert_images_to_avif, convert_images_to_jpeg, edit_border_images, export_images, export_to_pdf, export_to_word, images_from_grid, images_to_grid, import_images, import_images_from_pdf, noise_images, quicklook_images, resize_images
-from session import clear_temp, get_session
+from denoise import get_denoise_settings
+from encode_search import get_search_report, get_search_target
+from image_utils import convert_images_to_avif, convert_images_to_jpeg, edit_border_images, export_images, export_to_pdf, finish_export, export_to_word, images_from_grid, images_to_grid, import_images, import_images_from_pdf, noise_images, pipeline_images, quicklook_images, resize_images, start_export, submit_export
+from cache import clear_cache, get_cache_stats
+from manifest import collect_garbage, get_manifest_summary, has_manifest, load_working_set, set_working_set, undo_working_set
+from metrics import clear_metrics, export_events, get_stats, stage
+from session import clear_temp, ensure_path, get_session, get_session_path, new_session
+from workers import EXECUTOR_BACKENDS, shutdown_pool, start_pool, use_executor
+
+PIPELINE_ACTIONS = ['resize', 'crop', 'remove_noise', 'to_jpeg', 'to_avif']
+# Parâmetros aceitos por ação: filtram a linha de comando e validam o arquivo do modo batch
+ACTION_PARAMS = {
+    'resize': ['width', 'height', 'dpi', 'scale', 'exact'],
+    'save_images': ['output_directory_path', 'with_id', 'prefix', 'sufix', 'export_mode'],
+    'to_word': ['output_directory_path', 'dpi', 'file_name', 'print_dpi', 'image_format', 'quality'],
+    'to_pdf': ['output_directory_path', 'dpi', 'file_name', 'quality'],
+    'from_grid': ['cols', 'rows'],
+    'to_jpeg': ['dpi', 'quality', 'background_color', 'target_kb', 'target_ssim'],
+    'to_avif': ['dpi', 'quality', 'speed', 'no_alpha', 'subsampling', 'color', 'target_kb', 'target_ssim'],
+    'remove_noise': ['algorithm', 'radius', 'strength', 'scale', 'sharpen'],
+    'crop': ['left', 'right', 'top', 'bottom', 'scale', 'type', 'color', 'dpi', 'threshold', 'distance', 'softness'],
+    'to_grid': [
+        'rows', 'cols', 'no_guides', 'guide_color', 'guide_thickness', 'guide_size', 'padding', 'margin',
+        'file_name', 'guide_extend', 'guide_outward_size', 'draw_border', 'border_color', 'border_thickness',
+        'output', 'output_directory_path', 'dpi'
+    ],
+    'cache': [],
+    'stats': ['output'],
+    'gc': ['keep', 'max_mb'],
+    'undo': []
+}
+PDF_IMPORT_PARAMS = ['dpi', 'page_as_image', 'image_format', 'quality']
+IMPORT_PARAMS = PDF_IMPORT_PARAMS + ['import_mode']
 
 if __name__ == "__main__":
     # session_id = None
@@ -12,15 +51,70 @@ if __name__ == "__main__":
     all_images_info = []
     error_images_info = []
     selected_images = []
+    # None = fora do modo pipeline; lista = ações enfileiradas aguardando --action run_pipeline
+    pipeline_steps = None
 
     def get_selected_images_info():
         global old_images_info, all_images_info, error_images_info, selected_images
         return next(image_info for image_info in enumerate(all_images_info) if image_info.get('id') in selected_images)
 
+    def queue_pipeline_step(action, params):
+        global pipeline_steps
+        if pipeline_steps is None:
+            return False
+        pipeline_steps.append({'action': action, 'params': params})
+        print_log(pipeline_steps, title='Ação adicionada ao pipeline')
+        return True
+
+    def begin_pipeline(input_dict):
+        global pipeline_steps
+        pipeline_steps = []
+        print_log('Ações de transformação serão enfileiradas até --action run_pipeline', title='Pipeline iniciado')
+
+    def print_search_report(images_info):
+        rows, summary = get_search_report(images_info)
+        print_log(rows, title='Busca de qualidade', level=1)
+        print_log(summary, title='Busca de qualidade (resumo)', level=1)
+
+    def has_search_target(params):
+        return params.get('target_kb') is not None or params.get('target_ssim') is not None
+
+    def run_pipeline(input_dict):
+        global old_images_info, all_images_info, error_images_info, selected_images, pipeline_steps
+        steps = pipeline_steps or []
+        pipeline_steps = None
+        if not steps:
+            print_log('Nenhuma ação no pipeline', type='warning', level=1)
+            return
+        # Se a próxima ação é save_images, cada imagem é exportada assim que o pipeline a termina;
+        # o save_images em seguida só confirma (o sidecar pula o que já foi exportado)
+        export = None
+        on_result = None
+        if input_dict.get('action') == 'save_images' and input_dict.get('output_directory_path'):
+            export = start_export(**{key: input_dict[key] for key in ACTION_PARAMS['save_images'] if key in input_dict})
+
+            def on_result(result):
+                if result[0].get('status'):
+                    # Cópia: a exportação roda em outra thread e não pode mexer no status do resultado
+                    submit_export(export, result[0].copy())
+
+        result_new_images_info, result_old_images_info, result_error_images_info = pipeline_images(all_images_info, steps, on_result)
+        if export is not None:
+            finish_export(export)
+        print_log(result_new_images_info, title='Pipeline executado com sucesso', level=1)
+        print_log(result_error_images_info, title='Erros ao executar pipeline', type='error', level=1)
+        if any(has_search_target(step.get('params', {})) for step in steps):
+            print_search_report(result_new_images_info)
+        all_images_info = result_new_images_info
+        error_images_info = result_error_images_info
+        old_images_info = result_old_images_info
+
     def resize(input_dict):
         global old_images_info, all_images_info, error_images_info, selected_images
-        params_filter = ['width', 'height', 'dpi', 'scale']
+        params_filter = ACTION_PARAMS['resize']
         params = {key: input_dict[key] for key in params_filter if key in input_dict}
+        if queue_pipeline_step('resize', params):
+            return
         result_new_images_info, result_old_images_info, result_error_images_info = resize_images(all_images_info, **params)
         print_log(result_new_images_info, title = 'Resized images')
         print_log(result_old_images_info, title='Old Images')
@@ -31,7 +125,7 @@ if __name__ == "__main__":
 
     def save_images(input_dict):
         global old_images_info, all_images_info, error_images_info, selected_images
-        params_filter = ['output_directory_path', 'with_id', 'prefix', 'sufix']
+        params_filter = ACTION_PARAMS['save_images']
         params = {key: input_dict[key] for key in params_filter if key in input_dict}
         result_success_images_info, result_error_images_info = export_images(all_images_info, **params)
         print_log(result_success_images_info, title='Salvos com sucesso', level=1)
@@ -41,7 +135,7 @@ if __name__ == "__main__":
 
     def to_word(input_dict):
         global old_images_info, all_images_info, error_images_info, selected_images
-        params_filter = ['output_directory_path', 'dpi', 'file_name']
+        params_filter = ACTION_PARAMS['to_word']
         params = {key: input_dict[key] for key in params_filter if key in input_dict}
         result_success_images_info, result_error_images_info = export_to_word(all_images_info, **params)
         print_log(result_success_images_info, title='Salvos com sucesso', level=1)
@@ -51,7 +145,7 @@ if __name__ == "__main__":
 
     def to_pdf(input_dict):
         global old_images_info, all_images_info, error_images_info, selected_images
-        params_filter = ['output_directory_path', 'dpi', 'file_name']
+        params_filter = ACTION_PARAMS['to_pdf']
         params = {key: input_dict[key] for key in params_filter if key in input_dict}
         result_success_images_info, result_error_images_info = export_to_pdf(all_images_info, **params)
         print_log(result_success_images_info, title='Exportadas para PDF com sucesso', level=1)
@@ -61,7 +155,7 @@ if __name__ == "__main__":
 
     def from_grid(input_dict):
         global old_images_info, all_images_info, error_images_info, selected_images
-        params_filter = ['cols', 'rows']
+        params_filter = ACTION_PARAMS['from_grid']
         params = {key: input_dict[key] for key in params_filter if key in input_dict}
         result_success_images_info = images_from_grid(all_images_info, **params)
         print_log(result_success_images_info, title='Grid recortado')
@@ -73,31 +167,56 @@ if __name__ == "__main__":
 
     def to_jpeg(input_dict):
         global old_images_info, all_images_info, error_images_info, selected_images
-        params_filter = ['dpi', 'quality', 'background_color']
+        params_filter = ACTION_PARAMS['to_jpeg']
         params = {key: input_dict[key] for key in params_filter if key in input_dict}
+        try:
+            get_search_target(params.get('target_kb'), params.get('target_ssim'))
+        except ValueError as e:
+            print_log(e, type='error', level=1)
+            return
+        if queue_pipeline_step('to_jpeg', params):
+            return
         result_new_images_info, result_old_images_info, result_error_images_info = convert_images_to_jpeg(all_images_info, **params)
         print_log(result_new_images_info, title='Convertidas para JPEG com sucesso', level=1)
         print_log(result_error_images_info, title='Erros ao converter para JPEG', type='error', level=1)
+        if has_search_target(params):
+            print_search_report(result_new_images_info)
         all_images_info = result_new_images_info
         error_images_info = result_error_images_info
         old_images_info = result_old_images_info
 
     def to_avif(input_dict):
         global old_images_info, all_images_info, error_images_info, selected_images
-        params_filter = ['dpi', 'quality', 'speed', 'no_alpha', 'subsampling', 'color']
+        params_filter = ACTION_PARAMS['to_avif']
         params = {key: input_dict[key] for key in params_filter if key in input_dict}
+        try:
+            get_search_target(params.get('target_kb'), params.get('target_ssim'))
+        except ValueError as e:
+            print_log(e, type='error', level=1)
+            return
+        if queue_pipeline_step('to_avif', params):
+            return
         result_new_images_info, result_old_images_info, result_error_images_info = convert_images_to_avif(all_images_info, **params)
         print_log(result_new_images_info, title='Convertidas para AVIF com sucesso', level=1)
         print_log(result_error_images_info, title='Erros ao converter para AVIF', type='error', level=1)
+        if has_search_target(params):
+            print_search_report(result_new_images_info)
         all_images_info = result_new_images_info
         error_images_info = result_error_images_info
         old_images_info = result_old_images_info
 
     def remove_noise(input_dict):
         global old_images_info, all_images_info, error_images_info, selected_images
-        params_filter = []
+        params_filter = ACTION_PARAMS['remove_noise']
         params = {key: input_dict[key] for key in params_filter if key in input_dict}
-        result_new_images_info, result_old_images_info, result_error_images_info = noise_images(all_images_info)
+        try:
+            get_denoise_settings(**params)
+        except ValueError as e:
+            print_log(e, type='error', level=1)
+            return
+        if queue_pipeline_step('remove_noise', params):
+            return
+        result_new_images_info, result_old_images_info, result_error_images_info = noise_images(all_images_info, **params)
         print_log(result_new_images_info, title='Noise removido com sucesso', level=1)
         print_log(result_error_images_info, title='Erros ao remover noise', type='error', level=1)
         all_images_info = result_new_images_info
@@ -106,8 +225,10 @@ if __name__ == "__main__":
 
     def crop(input_dict):
         global old_images_info, all_images_info, error_images_info, selected_images
-        params_filter = ["left", "right", "top", "bottom", "scale", "type", "color", "dpi", "threshold"]
+        params_filter = ACTION_PARAMS['crop']
         params = {key: input_dict[key] for key in params_filter if key in input_dict}
+        if queue_pipeline_step('crop', params):
+            return
         result_new_images_info, result_old_images_info, result_error_images_info = edit_border_images(all_images_info, **params)
         print_log(result_new_images_info, title='Recortadas com sucesso', level=1)
         print_log(result_error_images_info, title='Erros ao recortar', type='error', level=1)
@@ -115,24 +236,20 @@ if __name__ == "__main__":
         error_images_info = result_error_images_info
         old_images_info = result_old_images_info
 
+    def cache_stats(input_dict):
+        print_log(get_cache_stats(), title='Cache', level=1)
+
+    def stats(input_dict):
+        # Resumo por etapa (ordenado pelo tempo total); --output grava os eventos (.jsonl ou Chrome trace .json)
+        print_log(get_stats(), title='Métricas por etapa', level=1)
+        if input_dict.get('output'):
+            output_path = export_events(ensure_path(input_dict.get('output')))
+            print_log(output_path, title='Métricas exportadas', level=1)
+
     def to_grid(input_dict):
         global old_images_info, all_images_info, error_images_info
 
-        params_filter = [
-            'rows', 'cols',
-            'no_guides',
-            'guide_color',
-            'guide_thickness',
-            'guide_size',
-            'padding',
-            'margin',
-            'file_name',
-            "guide_extend",
-            "guide_outward_size",
-            "draw_border",
-            "border_color",
-            "border_thickness"
-        ]
+        params_filter = ACTION_PARAMS['to_grid']
 
         params = {key: input_dict[key] for key in params_filter if key in input_dict}
 
@@ -145,6 +262,172 @@ if __name__ == "__main__":
         old_images_info = result_old
         error_images_info = result_error
 
+    def gc(input_dict):
+        max_mb = input_dict.get('max_mb')
+        report = collect_garbage(session_id, input_dict.get('keep'), None if max_mb is None else int(max_mb * 1024 ** 2))
+        print_log(report, title='GC', level=1)
+
+    def undo(input_dict):
+        global all_images_info, error_images_info, old_images_info
+        images_info = undo_working_set(session_id)
+        if images_info is None:
+            print_log('Nenhuma geração anterior para desfazer', type='warning', level=1)
+            return
+        old_images_info = all_images_info
+        all_images_info = images_info
+        error_images_info = []
+        print_log(all_images_info, title='Geração anterior restaurada', level=1)
+
+    def sync_working_set():
+        # Persiste o conjunto de trabalho e coleta as gerações que saíram da janela de undo
+        set_working_set(session_id, all_images_info, error_images_info)
+        if manifest.GC_ENABLED:
+            report = collect_garbage(session_id)
+            if report.get('files'):
+                print_log(report, title='GC', level=2)
+
+    def run_action(input_dict):
+        global pipeline_steps
+        action = input_dict.get('action')
+        previous_state = (all_images_info, error_images_info)
+
+        # Ações que não entram no pipeline executam antes o que estiver enfileirado
+        if pipeline_steps and action not in PIPELINE_ACTIONS + ['run_pipeline', 'cancel_pipeline']:
+            with stage('run_pipeline', cat='action'):
+                run_pipeline(input_dict)
+
+        if action is not None:
+            # --executor por ação: process, thread, inline ou auto (padrão: o da inicialização)
+            executor = input_dict.get('executor')
+            if executor is not None and executor not in EXECUTOR_BACKENDS:
+                print_log(f"Executor inválido '{executor}' (use {', '.join(EXECUTOR_BACKENDS)})", type='error', level=1)
+                return
+
+            with stage(action, cat='action'), use_executor(executor):
+                match action:
+                    case 'resize':
+                        resize(input_dict)
+                    case 'save_images':
+                        save_images(input_dict)
+                    case 'to_word':
+                        to_word(input_dict)
+                    case 'to_pdf':
+                        to_pdf(input_dict)
+                    case 'from_grid':
+                        from_grid(input_dict)
+                    case 'preview':
+                        preview_images(input_dict)
+                    case 'to_jpeg':
+                        to_jpeg(input_dict)
+                    case 'to_avif':
+                        to_avif(input_dict)
+                    case 'remove_noise':
+                        remove_noise(input_dict)
+                    case 'crop':
+                        crop(input_dict)
+                    case 'to_grid':
+                        to_grid(input_dict)
+                    case 'begin_pipeline':
+                        begin_pipeline(input_dict)
+                    case 'run_pipeline':
+                        run_pipeline(input_dict)
+                    case 'cancel_pipeline':
+                        pipeline_steps = None
+                    case 'cache':
+                        cache_stats(input_dict)
+                    case 'stats':
+                        stats(input_dict)
+                    case 'gc':
+                        gc(input_dict)
+                    case 'undo':
+                        undo(input_dict)
+                    case _:
+                        print_log('Invalid action', type='error', level=1)
+
+        if input_dict.get('clear_all'):
+            clear_temp()
+
+        if input_dict.get('clear_cache'):
+            clear_cache()
+
+        if input_dict.get('clear_stats'):
+            clear_metrics()
+
+        # Ações que trocaram o conjunto de trabalho persistem o novo estado no manifesto
+        if previous_state[0] is not all_images_info or previous_state[1] is not error_images_info:
+            sync_working_set()
+
+    def import_job(session_id, job):
+        images_path = as_path_list(job.get('images_path'))
+        with stage('import', cat='action'):
+            if job.get('pdf'):
+                params = {key: job[key] for key in PDF_IMPORT_PARAMS if key in job}
+                return import_images_from_pdf(session_id, images_path, **params)
+            return import_images(session_id, images_path, job.get('import_mode', 'auto'))
+
+    def run_batch(args_dict):
+        global all_images_info, error_images_info, old_images_info, pipeline_steps, session_id
+        try:
+            batch = load_batch_file(args_dict.get('batch'))
+        except (OSError, ValueError) as e:
+            print_log(f"Arquivo de batch inválido '{args_dict.get('batch')}': {e}", type='error', level=1)
+            return False
+
+        jobs = get_batch_jobs(batch, args_dict, IMPORT_PARAMS)
+        steps = get_batch_steps(batch)
+        errors = validate_batch(jobs, steps, ACTION_PARAMS, IMPORT_PARAMS)
+        if errors:
+            print_log(errors, title='Batch inválido', type='error', level=1)
+            return False
+
+        start_pool(args_dict.get('workers'))
+
+        # Cada job tem sessão própria; a importação do próximo roda em uma thread enquanto este processa
+        sessions = [new_session() for _ in jobs]
+        summary = []
+        with ThreadPoolExecutor(max_workers=1) as prefetch:
+            next_import = prefetch.submit(import_job, sessions[0], jobs[0])
+
+            for index, job in enumerate(jobs):
+                job_name = get_job_name(job, index + 1)
+                start = time.perf_counter()
+                current_import = next_import
+                if index + 1 < len(jobs):
+                    next_import = prefetch.submit(import_job, sessions[index + 1], jobs[index + 1])
+
+                try:
+                    session_id = sessions[index]
+                    all_images_info, error_images_info = current_import.result()
+                    old_images_info = []
+                    sync_working_set()
+
+                    with stage(job_name, cat='job'):
+                        # Transformações consecutivas viram um único pipeline (uma decodificação por imagem)
+                        pipeline_steps = []
+                        for step in steps:
+                            run_action(format_step(step, job_name))
+                        if pipeline_steps:
+                            run_pipeline({})
+                        pipeline_steps = None
+                    status = True
+                except Exception as e:
+                    print_log(f"Job '{job_name}' falhou: {e}", type='error', level=1)
+                    pipeline_steps = None
+                    status = False
+
+                summary.append({
+                    'job': job_name,
+                    'status': status,
+                    'images': len(all_images_info),
+                    'errors': len(error_images_info),
+                    'seconds': round(time.perf_counter() - start, 2)
+                })
+                if not args_dict.get('keep_sessions'):
+                    shutil.rmtree(get_session_path(sessions[index]), ignore_errors=True)
+
+        print_log(summary, title='Batch concluído', level=1)
+        return all(item.get('status') for item in summary)
+
     args_string = " ".join(shlex.quote(arg) for arg in sys.argv[1:])
 
     args_string = args_string or input()
@@ -152,52 +435,52 @@ if __name__ == "__main__":
     print_log(args_dict, title='Parsed ARGS')
 
     session_id = args_dict.get('session_id')
-    is_pdf = args_dict.get('pdf')
-    images_path = args_dict.get('images_path', [])
-    images_path = [images_path] if isinstance(images_path, str) else images_path
-    params_filter = ['dpi', 'page_as_image']
-    params = {key: args_dict[key] for key in params_filter if key in args_dict}
+
+    cache.CACHE_ENABLED = not args_dict.get('no_cache')
+    metrics.METRICS_ENABLED = not args_dict.get('no_metrics')
+    clear_metrics()
+    if args_dict.get('cache_max_mb') is not None:
+        cache.CACHE_MAX_BYTES = int(args_dict.get('cache_max_mb') * 1024 ** 2)
+    manifest.GC_ENABLED = not args_dict.get('no_gc')
+    if args_dict.get('gc_keep') is not None:
+        manifest.GC_KEEP_GENERATIONS = args_dict.get('gc_keep')
+    if args_dict.get('gc_max_mb') is not None:
+        manifest.GC_MAX_BYTES = int(args_dict.get('gc_max_mb') * 1024 ** 2)
+    if args_dict.get('cv2_threads') is not None:
+        workers.CV2_THREADS = args_dict.get('cv2_threads')
+    if args_dict.get('executor') is not None:
+        if args_dict.get('executor') not in EXECUTOR_BACKENDS:
+            print_log(f"Executor inválido '{args_dict.get('executor')}' (use {', '.join(EXECUTOR_BACKENDS)})", type='error', level=1)
+            sys.exit(1)
+        workers.EXECUTOR_BACKEND = args_dict.get('executor')
+
+    if args_dict.get('batch'):
+        # Modo não interativo: --batch arquivo.json|yaml [--jobs pasta1 pasta2 ...]
+        success = run_batch(args_dict)
+        shutdown_pool()
+        sys.exit(0 if success else 1)
 
     session_id = get_session(session_id)
+    start_pool(args_dict.get('workers'))
+
+    if has_manifest(session_id):
+        # Retomada: o conjunto de trabalho vem do manifesto; --images_path ainda soma novas imagens
+        all_images_info, error_images_info = load_working_set(session_id)
+        print_log(get_manifest_summary(session_id), title='Sessão retomada', level=1)
 
-    all_images_info, error_images_info = import_images_from_pdf(session_id, images_path, **params) if is_pdf else import_images(session_id, images_path)
+    imported_images_info, imported_error_images_info = import_job(session_id, args_dict)
+    all_images_info += imported_images_info
+    error_images_info += imported_error_images_info
+    sync_working_set()
     print_log(all_images_info, title='Imported images info')
 
     while True:
         input_string = input()
         input_dict = parse_args(input_string)
-
-        if input_dict.get('action') is not None:
-            match input_dict.get('action'):
-                case 'resize':
-                    resize(input_dict)
-                case 'save_images':
-                    save_images(input_dict)
-                case 'to_word':
-                    to_word(input_dict)
-                case 'to_pdf':
-                    to_pdf(input_dict)
-                case 'from_grid':
-                    from_grid(input_dict)
-                case 'preview':
-                    preview_images(input_dict)
-                case 'to_jpeg':
-                    to_jpeg(input_dict)
-                case 'to_avif':
-                    to_avif(input_dict)
-                case 'remove_noise':
-                    remove_noise(input_dict)
-                case 'crop':
-                    crop(input_dict)
-                case 'to_grid':
-                    to_grid(input_dict)
-                case _:
-                    print_log('Invalid action', type='error', level=1)
-
-        if input_dict.get('clear_all'):
-            clear_temp()
+        run_action(input_dict)
 
         if input_dict.get('exit'):
+            shutdown_pool()
             break
 
 
@@ -4,9 +4,16 @@ import shutil
 from pathlib import Path
 from debug_log import print_log
 
+try:
+    import fcntl
+except ImportError:
+    fcntl = None
+
 DATA_FOLDER_PATH = Path("data")
 TEMP_DATA_FOLDER_PATH = DATA_FOLDER_PATH / "temp"
 SESSIONS_DATA_FOLDER = TEMP_DATA_FOLDER_PATH / "sessions"
+IMPORT_MODES = ['auto', 'copy', 'hardlink', 'reflink', 'reference']
+FICLONE = 0x40049409  # _IOW(0x94, 9, int), Linux
 
 def new_uuid():
     return secrets.token_urlsafe(8)
@@ -44,6 +51,47 @@ def copy_file(source_path, destination_path):
         error = f'Erro ao copiar {source_path}: {e}'
     return False, error
 
+def clone_file(source_path, destination_path):
+    # Reflink (FICLONE: btrfs, XFS...) compartilha os blocos; senão copy_file_range copia dentro do kernel
+    with open(source_path, 'rb') as source, open(destination_path, 'wb') as destination:
+        try:
+            fcntl.ioctl(destination.fileno(), FICLONE, source.fileno())
+            return 'reflink'
+        except (OSError, AttributeError):
+            pass
+
+        if not hasattr(os, 'copy_file_range'):
+            raise OSError('copy_file_range indisponível')
+        remaining = os.fstat(source.fileno()).st_size
+        while remaining > 0:
+            copied = os.copy_file_range(source.fileno(), destination.fileno(), remaining)
+            if copied == 0:
+                break
+            remaining -= copied
+        return 'copy_file_range'
+
+def link_file(source_path, destination_path, mode = 'auto'):
+    # Retorna (status, erro, modo usado); qualquer falha cai para a cópia normal.
+    # 'auto' nunca usa hardlink: o arquivo da sessão continua independente da origem
+    source_path = ensure_path(source_path)
+    destination_path = ensure_path(destination_path)
+
+    if mode == 'hardlink':
+        try:
+            os.link(source_path, destination_path)
+            return True, '', 'hardlink'
+        except OSError:
+            pass
+
+    if mode in ('auto', 'reflink'):
+        try:
+            return True, '', clone_file(source_path, destination_path)
+        except OSError:
+            pass
+
+    status, error = copy_file(source_path, destination_path)
+    return status, error, 'copy'
+
 def clear_temp():
     if TEMP_DATA_FOLDER_PATH.is_dir():
         shutil.rmtree(TEMP_DATA_FOLDER_PATH)
@@ -64,10 +112,8 @@ def clear_sessions():
 
 def get_session(session_id):
     if session_id:
-        print_log(get_dirs(SESSIONS_DATA_FOLDER))
-        files = get_files(SESSIONS_DATA_FOLDER / session_id / 'images')
-        for file in files:
-            print_log(file.stem)
+        # Sem varrer a pasta: o estado da sessão vem do manifesto (ver manifest.load_working_set)
+        print_log(get_session_path(session_id), title='Sessão existente')
         return session_id
     
     clear_sessions()
@@ -0,0 +1,53 @@
+import numpy as np
+import tiles
+
+def write_ppm(path, header, pixels):
+    with open(path, 'wb') as file:
+        file.write(header)
+        file.write(pixels.tobytes())
+
+def test_ppm_header_whitespace_pixels(tmp_path, monkeypatch):
+    # Primeiros pixels com valores de espaço (0x09-0x0D, 0x20): não podem entrar no cabeçalho
+    monkeypatch.chdir(tmp_path)
+    pixels = np.full((3, 4, 3), 200, dtype=np.uint8)
+    pixels[0, 0] = (0x20, 0x09, 0x0A)
+    pixels[0, 1] = (0x0D, 0x0B, 0x0C)
+    path = tmp_path / 'space.ppm'
+    write_ppm(path, b'P6\n4 3\n255\n', pixels)
+
+    assert tiles.read_ppm_header(path) == (4, 3, 11)
+    scratch, mode = tiles.load_scratch(path)
+    assert mode == 'RGBX'
+    assert np.array_equal(scratch[..., :3], pixels)
+
+def test_ppm_header_comments(tmp_path):
+    pixels = np.zeros((2, 2, 3), dtype=np.uint8)
+    header = b'P6 # gerado\n# outro comentario\n2\t2 # dims\n255 '
+    path = tmp_path / 'comments.ppm'
+    write_ppm(path, header, pixels)
+
+    assert tiles.read_ppm_header(path) == (2, 2, len(header))
+
+def test_ppm_header_rejects_other_formats(tmp_path):
+    path = tmp_path / 'gray.ppm'
+    write_ppm(path, b'P5\n2 2\n255\n', np.zeros((2, 2), dtype=np.uint8))
+    assert tiles.read_ppm_header(path) is None
+
+    path = tmp_path / 'deep.ppm'
+    write_ppm(path, b'P6\n2 2\n65535\n', np.zeros((2, 2, 6), dtype=np.uint8))
+    assert tiles.read_ppm_header(path) is None
+
+def test_tiled_filter_keeps_mode(tmp_path, monkeypatch):
+    # L continua L e o alfa do RGBA passa inalterado; só a cor é filtrada
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.setattr(tiles, 'TILE_ROWS', 4)
+    rng = np.random.default_rng(0)
+    for mode, channels in (('L', 1), ('RGBA', 4), ('RGBX', 4)):
+        source = rng.integers(0, 256, (10, 6, channels), dtype=np.uint8)
+        output, output_mode = tiles.tiled_filter(source, lambda color: 255 - color, 0, mode)
+        assert output_mode == mode
+        assert output.shape == source.shape
+        color = slice(0, 1) if channels == 1 else slice(0, 3)
+        assert np.array_equal(output[..., color], 255 - source[..., color])
+        if mode == 'RGBA':
+            assert np.array_equal(output[..., 3], source[..., 3])
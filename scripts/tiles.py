@@ -0,0 +1,266 @@
+import math
+import mmap
+import struct
+import tempfile
+import zlib
+import numpy as np
+from PIL import Image
+from session import TEMP_DATA_FOLDER_PATH, new_dir
+
+# Motor em faixas para imagens gigantes: a imagem vive em arrays mapeados em disco (scratch)
+# e cada operação só materializa uma faixa (mais a borda de sobreposição) por vez.
+# Só a entrada PPM é lida em faixas: PNG/JPEG são decodificados inteiros uma vez na carga
+# (ver scratch_from_image), então nesses formatos o pico de RSS é o do quadro decodificado.
+
+TILE_MIN_PIXELS = 40_000_000  # a partir daqui as operações usam o motor em faixas
+TILE_ROWS = 512  # linhas por faixa
+TILE_FORMATS = ('.png', '.jpg', '.jpeg', '.ppm')
+SCRATCH_FOLDER_PATH = TEMP_DATA_FOLDER_PATH / "scratch"
+PPM_HEADER_MAX = 1024  # cabeçalho com comentários cabe folgado
+
+def should_tile(size, ext):
+    return size[0] * size[1] >= TILE_MIN_PIXELS and ext.lower() in TILE_FORMATS
+
+def new_scratch(height, width, channels):
+    new_dir(TEMP_DATA_FOLDER_PATH, 'scratch')
+    # Arquivo anônimo: some do disco assim que o array for liberado
+    file = tempfile.TemporaryFile(dir=SCRATCH_FOLDER_PATH)
+    return np.memmap(file, dtype=np.uint8, mode='w+', shape=(height, width, channels))
+
+def release(array):
+    # Grava as páginas sujas e devolve as residentes ao kernel: o RSS fica no tamanho da faixa
+    base = array
+    while base is not None and not isinstance(base, mmap.mmap):
+        base = getattr(base, '_mmap', None) or getattr(base, 'base', None)
+    if isinstance(base, mmap.mmap):
+        base.flush()
+        if hasattr(base, 'madvise') and hasattr(mmap, 'MADV_DONTNEED'):
+            base.madvise(mmap.MADV_DONTNEED)
+
+def strips(height, rows = None):
+    rows = rows or TILE_ROWS
+    for top in range(0, height, rows):
+        yield top, min(top + rows, height)
+
+def read_ppm_header(path):
+    # Quatro campos (magic, largura, altura, maxval) separados por espaço, com comentários '#' até o
+    # fim da linha; os pixels começam um único byte de espaço depois do maxval (que pode ser qualquer
+    # valor, inclusive espaço: não dá para usar split no cabeçalho)
+    with open(path, 'rb') as file:
+        header = file.read(PPM_HEADER_MAX)
+
+    fields = []
+    position = 0
+    while len(fields) < 4 and position < len(header):
+        byte = header[position:position + 1]
+        if byte.isspace():
+            position += 1
+        elif byte == b'#':
+            end = header.find(b'\n', position)
+            position = len(header) if end < 0 else end + 1
+        else:
+            start = position
+            while position < len(header) and not header[position:position + 1].isspace() and header[position:position + 1] != b'#':
+                position += 1
+            fields.append(header[start:position])
+
+    # O token precisa terminar em um byte de espaço dentro do que foi lido
+    if len(fields) < 4 or fields[0] != b'P6' or position >= len(header) or not header[position:position + 1].isspace():
+        return None
+    try:
+        width, height, maxval = (int(field) for field in fields[1:])
+    except ValueError:
+        return None
+    if maxval != 255:
+        return None
+    return width, height, position + 1
+
+def load_scratch(path, img = None):
+    # Retorna (array HxWxC, modo); C é 1 (L) ou 4 (RGBX/RGBA) para que o PIL possa usar o mesmo buffer.
+    # img permite reaproveitar uma imagem já aberta (ex.: com draft de JPEG aplicado)
+    if img is not None:
+        return scratch_from_image(img)
+
+    ppm = read_ppm_header(path) if str(path).lower().endswith(('.ppm', '.pnm')) else None
+    if ppm is not None:
+        # PPM binário é mapeado direto do arquivo, sem decodificar
+        width, height, offset = ppm
+        source = np.memmap(path, dtype=np.uint8, mode='r', offset=offset, shape=(height, width, 3))
+        scratch = new_scratch(height, width, 4)
+        for top, bottom in strips(height):
+            scratch[top:bottom, :, :3] = source[top:bottom]
+            scratch[top:bottom, :, 3] = 255
+            release(scratch)
+            release(source)
+        return scratch, "RGBX"
+
+    with Image.open(path) as img:
+        return scratch_from_image(img)
+
+def scratch_from_image(img):
+    if img.mode in ("RGBA", "LA", "PA") or (img.mode == "P" and "transparency" in img.info):
+        mode, channels = "RGBA", 4
+    elif img.mode in ("L", "1"):
+        mode, channels = "L", 1
+    else:
+        mode, channels = "RGBX", 4
+
+    # PNG/JPEG não têm decodificação parcial no Pillow: o quadro inteiro fica na memória até a
+    # imagem ser fechada (o draft de JPEG só reduz a escala). A conversão de modo e a cópia para o
+    # disco são por faixa, e dali em diante as operações e a escrita ficam no tamanho da faixa
+    width, height = img.size
+    scratch = new_scratch(height, width, channels)
+    for top, bottom in strips(height):
+        strip = np.asarray(img.crop((0, top, width, bottom)).convert(mode))
+        scratch[top:bottom] = strip.reshape(bottom - top, width, channels)
+        release(scratch)
+
+    return scratch, mode
+
+def to_pil(array, mode):
+    height, width = array.shape[:2]
+    array = np.ascontiguousarray(array)
+    return Image.frombuffer(mode, (width, height), array, 'raw', mode, 0, 1)
+
+def from_pil(img, channels):
+    return np.asarray(img).reshape(img.height, img.width, channels)
+
+def contiguous(source):
+    if source.flags.c_contiguous:
+        return source
+    height, width, channels = source.shape
+    output = new_scratch(height, width, channels)
+    for top, bottom in strips(height):
+        output[top:bottom] = source[top:bottom]
+        release(output)
+        release(source)
+    return output
+
+def tiled_crop(source, box):
+    left, top, right, bottom = box
+    # Recorte é só uma visão do array mapeado
+    return source[max(top, 0):bottom, max(left, 0):right]
+
+def tiled_resize(source, mode, size, resample):
+    height, width, channels = source.shape
+    out_width, out_height = size
+    scale_y = height / out_height
+    # Suporte do filtro (LANCZOS = 3) cresce com o fator de redução
+    margin = math.ceil(3 * max(scale_y, 1)) + 2
+    output = new_scratch(out_height, out_width, channels)
+
+    for out_top, out_bottom in strips(out_height):
+        source_top = out_top * scale_y
+        source_bottom = out_bottom * scale_y
+        strip_top = max(0, math.floor(source_top) - margin)
+        strip_bottom = min(height, math.ceil(source_bottom) + margin)
+
+        strip = to_pil(source[strip_top:strip_bottom], mode)
+        box = (0, source_top - strip_top, width, source_bottom - strip_top)
+        resized = strip.resize((out_width, out_bottom - out_top), resample, box=box)
+        output[out_top:out_bottom] = from_pil(resized, channels)
+        release(output)
+        release(source)
+
+    return output
+
+def tiled_filter(source, filter_function, halo, mode):
+    # filter_function recebe um array contíguo só com a cor (HxW em L, HxWx3 nos demais); o alfa
+    # passa inalterado. halo = raio total dos kernels aplicados
+    height, width, channels = source.shape
+    output = new_scratch(height, width, channels)
+
+    for top, bottom in strips(height):
+        strip_top = max(0, top - halo)
+        strip_bottom = min(height, bottom + halo)
+        strip = source[strip_top:strip_bottom]
+        color = np.ascontiguousarray(strip[..., 0] if channels == 1 else strip[..., :3])
+        filtered = filter_function(color)[top - strip_top:bottom - strip_top]
+        if channels == 1:
+            output[top:bottom, :, 0] = filtered
+        else:
+            output[top:bottom, :, :3] = filtered
+            output[top:bottom, :, 3] = source[top:bottom, :, 3] if mode == "RGBA" else 255
+        release(output)
+        release(source)
+
+    return output, mode
+
+def tiled_flatten(source, mode, background_rgb):
+    # Mesmo efeito de colar sobre um fundo sólido (saída JPEG)
+    if mode != "RGBA":
+        return source, mode
+
+    height, width, _ = source.shape
+    output = new_scratch(height, width, 4)
+    background = np.array(background_rgb, dtype=np.float32)
+
+    for top, bottom in strips(height):
+        strip = source[top:bottom]
+        alpha = strip[..., 3:4].astype(np.float32) / 255
+        blended = strip[..., :3] * alpha + background * (1 - alpha)
+        output[top:bottom, :, :3] = np.rint(blended).astype(np.uint8)
+        output[top:bottom, :, 3] = 255
+        release(output)
+        release(source)
+
+    return output, "RGBX"
+
+def png_chunk(file, kind, data):
+    file.write(struct.pack('>I', len(data)) + kind + data)
+    file.write(struct.pack('>I', zlib.crc32(kind + data) & 0xffffffff))
+
+def write_png_tiled(source, mode, path, dpi = None):
+    height, width, channels = source.shape
+    color_type, out_channels = {"L": (0, 1), "RGBA": (6, 4), "RGBX": (2, 3)}[mode]
+    compressor = zlib.compressobj(6)
+
+    with open(path, 'wb') as file:
+        file.write(b'\x89PNG\r\n\x1a\n')
+        png_chunk(file, b'IHDR', struct.pack('>IIBBBBB', width, height, 8, color_type, 0, 0, 0))
+        if dpi:
+            pixels_per_meter = round(dpi / 0.0254)
+            png_chunk(file, b'pHYs', struct.pack('>IIB', pixels_per_meter, pixels_per_meter, 1))
+
+        # IDAT escrito faixa a faixa: cada linha com filtro 0 (None) na frente
+        for top, bottom in strips(height):
+            rows = source[top:bottom, :, :out_channels].reshape(bottom - top, width * out_channels)
+            filtered = np.zeros((bottom - top, width * out_channels + 1), dtype=np.uint8)
+            filtered[:, 1:] = rows
+            data = compressor.compress(filtered.tobytes())
+            if data:
+                png_chunk(file, b'IDAT', data)
+            release(source)
+
+        png_chunk(file, b'IDAT', compressor.flush())
+        png_chunk(file, b'IEND', b'')
+
+def write_ppm_tiled(source, mode, path):
+    height, width, _ = source.shape
+    magic, out_channels = (b'P5', 1) if mode == "L" else (b'P6', 3)
+
+    with open(path, 'wb') as file:
+        file.write(magic + f'\n{width} {height}\n255\n'.encode())
+        for top, bottom in strips(height):
+            file.write(np.ascontiguousarray(source[top:bottom, :, :out_channels]).tobytes())
+            release(source)
+
+def write_tiled(source, mode, path, format = None, dpi = None, quality = None):
+    format = (format or path.suffix[1:]).upper()
+    if format == 'PNG':
+        write_png_tiled(source, mode, path, dpi)
+        return
+    if format == 'PPM':
+        write_ppm_tiled(source, mode, path)
+        return
+
+    # JPEG: o PIL lê direto do buffer mapeado (RGBX/L sem cópia); as páginas lidas são do
+    # arquivo de scratch e podem ser devolvidas pelo kernel, ao contrário de memória anônima
+    save_args = {'format': 'JPEG'}
+    if dpi is not None:
+        save_args['dpi'] = (dpi, dpi)
+    if quality is not None:
+        save_args['quality'] = quality
+    if mode == "RGBA":
+        mode = "RGBX"
+    to_pil(contiguous(source), mode).save(path, **save_args)
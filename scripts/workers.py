@@ -0,0 +1,250 @@
+import atexit
+import time
+from collections import deque
+from contextlib import contextmanager
+from functools import partial
+from multiprocessing import Pool, cpu_count
+from multiprocessing.pool import ThreadPool
+import metrics
+from debug_log import print_log
+from metrics import stage, traced
+
+# Executores: 'process' (Pool de processos), 'thread' (threads no processo principal: sem pickle do
+# image_info e com os caches compartilhados; Pillow e OpenCV soltam o GIL na decodificação, filtros e
+# codificação), 'inline' (uma tarefa por vez, no próprio processo principal) e 'auto' (escolhe por operação).
+# Todas as ações passam por map_scheduled, map_traced ou imap_bounded, que resolvem o executor aqui.
+
+pool = None
+pool_size = None
+thread_pool = None
+EXECUTOR_BACKENDS = ['auto', 'process', 'thread', 'inline']
+EXECUTOR_BACKEND = 'auto'  # --executor na inicialização; cada ação pode trocar com --executor
+# Operações que no modo auto rodam em threads: só Pillow/OpenCV, sem estado global por processo
+THREAD_OPERATIONS = {'resize', 'remove_noise', 'to_jpeg', 'to_avif'}
+# PyMuPDF (fitz) não é thread-safe: mesmo com --executor thread, a rasterização fica em processos
+PROCESS_OPERATIONS = {'rasterize_pdf_pages'}
+CV2_THREADS = None  # threads do OpenCV por tarefa paralela (None = núcleos divididos entre as tarefas)
+SCHEDULE_CHUNKS_PER_WORKER = 4  # pedaços por worker no despacho por custo: cauda curta sem um despacho por item
+PROGRESS_INTERVAL = 2.0  # segundos entre mensagens de progresso
+
+current_backend = None
+# Threads que cada tarefa pode usar por dentro (OpenCV, codificador AVIF): definido por processo
+task_threads = cpu_count()
+
+def get_cv2_threads(processes):
+    # Sem limite, cada tarefa abre uma thread por núcleo e N tarefas disputam os mesmos núcleos
+    return CV2_THREADS if CV2_THREADS is not None else max(1, cpu_count() // processes)
+
+def set_task_threads(threads):
+    global task_threads
+    import cv2
+    task_threads = threads
+    cv2.setNumThreads(threads)
+
+def get_task_threads():
+    return task_threads
+
+def warm_up_worker(cv2_threads, metrics_enabled, metrics_run_path):
+    # Importa cv2/fitz/docx/reportlab uma única vez por processo, antes da primeira ação.
+    # Com spawn (padrão no macOS) o worker reimporta metrics: --no_metrics e a pasta da execução vêm junto
+    import image_utils
+    metrics.METRICS_ENABLED = metrics_enabled
+    metrics.METRICS_RUN_PATH = metrics_run_path
+    set_task_threads(cv2_threads)
+
+def ping(value):
+    return value
+
+def start_pool(processes = None):
+    global pool, pool_size
+
+    if pool is not None:
+        return pool
+
+    pool_size = processes or cpu_count()
+    pool = Pool(
+        processes=pool_size, initializer=warm_up_worker,
+        initargs=(get_cv2_threads(pool_size), metrics.METRICS_ENABLED, metrics.METRICS_RUN_PATH)
+    )
+    # Garante que todos os processos subiram e já fizeram os imports
+    pool.map(ping, range(pool_size), chunksize=1)
+    print_log(f'{pool_size} processos prontos ({get_cv2_threads(pool_size)} threads OpenCV cada)', title='Worker pool')
+
+    return pool
+
+def get_pool():
+    return pool if pool is not None else start_pool()
+
+def get_pool_size():
+    get_pool()
+    return pool_size
+
+def get_thread_pool():
+    global thread_pool
+
+    if thread_pool is None:
+        # Mesmo número de tarefas em paralelo que a pool de processos
+        thread_pool = ThreadPool(processes=get_pool_size())
+    return thread_pool
+
+class InlineResult:
+    def __init__(self, value):
+        self.value = value
+
+    def get(self):
+        return self.value
+
+class InlinePool:
+    # Mesma interface da Pool usada abaixo, executando cada tarefa na hora, no processo principal
+    def map(self, func, items, chunksize = None):
+        return [func(item) for item in items]
+
+    def imap_unordered(self, func, items, chunksize = 1):
+        return (func(item) for item in items)
+
+    def apply_async(self, func, args = ()):
+        return InlineResult(func(*args))
+
+@contextmanager
+def use_executor(backend):
+    # Executor de uma ação (--executor); None mantém o da inicialização
+    global current_backend
+
+    if backend is not None and backend not in EXECUTOR_BACKENDS:
+        raise ValueError(f"Executor inválido '{backend}' (use {', '.join(EXECUTOR_BACKENDS)})")
+
+    previous = current_backend
+    current_backend = backend
+    try:
+        yield
+    finally:
+        current_backend = previous
+
+def resolve_backend(name, count = None):
+    backend = current_backend or EXECUTOR_BACKEND
+    if name in PROCESS_OPERATIONS and backend == 'thread':
+        return 'process'
+    if backend != 'auto':
+        return backend
+    if count is not None and count <= 1:
+        # Uma imagem só: despachar para outro processo custa mais que o trabalho
+        return 'inline'
+    return 'thread' if name in THREAD_OPERATIONS else 'process'
+
+def get_executor(name, count = None):
+    # Pool do executor resolvido; nos executores do processo principal, ajusta antes as threads
+    # internas de cada tarefa para que tarefas x threads não passe do número de núcleos
+    backend = resolve_backend(name, count)
+    match backend:
+        case 'process':
+            return get_pool()
+        case 'thread':
+            set_task_threads(get_cv2_threads(get_pool_size()))
+            return get_thread_pool()
+        case 'inline':
+            set_task_threads(get_cv2_threads(1))
+            return InlinePool()
+
+def get_worker_pids():
+    if pool is None:
+        return []
+    return [process.pid for process in pool._pool]
+
+def shutdown_pool():
+    global pool, pool_size, thread_pool
+
+    if thread_pool is not None:
+        thread_pool.close()
+        thread_pool.join()
+        thread_pool = None
+
+    if pool is None:
+        return
+
+    pool.close()
+    pool.join()
+    pool = None
+    pool_size = None
+    print_log('Processos encerrados', title='Worker pool')
+
+def map_traced(name, func, items, chunksize = None):
+    # pool.map com um evento de despacho e um evento por tarefa (ver metrics)
+    items = list(items)
+    executor = get_executor(name, len(items))
+    task, dispatch = traced(name, func)
+    with stage(name, cat='dispatch', id=dispatch, items=len(items), executor=resolve_backend(name, len(items))):
+        return executor.map(task, items, chunksize)
+
+def plan_chunks(costs, workers):
+    # Maior primeiro (LPT). Cada pedaço soma até total / (workers * N) de custo: imagens enormes
+    # vão sozinhas no começo e as pequenas viajam juntas no fim, equilibrando a cauda
+    order = sorted(range(len(costs)), key=lambda index: costs[index], reverse=True)
+    target = sum(costs) / (workers * SCHEDULE_CHUNKS_PER_WORKER)
+    chunks = []
+    chunk = []
+    chunk_cost = 0
+
+    for index in order:
+        if chunk and chunk_cost + costs[index] > target:
+            chunks.append(chunk)
+            chunk = []
+            chunk_cost = 0
+        chunk.append(index)
+        chunk_cost += costs[index]
+
+    if chunk:
+        chunks.append(chunk)
+    return chunks
+
+def run_chunk(task, chunk):
+    return [(index, task(item)) for index, item in chunk]
+
+def imap_scheduled(name, func, items, costs = None):
+    # Gera (índice, resultado) na ordem em que terminam; costs estima o trabalho de cada item
+    items = list(items)
+    costs = costs if costs is not None else [1] * len(items)
+    chunks = [[(index, items[index]) for index in chunk] for chunk in plan_chunks(costs, get_pool_size())]
+    backend = resolve_backend(name, len(items))
+    executor = get_executor(name, len(items))
+    task, dispatch = traced(name, func)
+
+    with stage(name, cat='dispatch', id=dispatch, items=len(items), chunks=len(chunks), executor=backend):
+        for results in executor.imap_unordered(partial(run_chunk, task), chunks):
+            yield from results
+
+def map_scheduled(name, func, items, costs = None, on_result = None):
+    # Como pool.map (lista na ordem de items), com despacho por custo e progresso ao vivo.
+    # on_result(resultado) roda no processo principal assim que cada item termina, fora de ordem
+    items = list(items)
+    results = [None] * len(items)
+    last_report = time.monotonic()
+
+    for done, (index, result) in enumerate(imap_scheduled(name, func, items, costs), 1):
+        results[index] = result
+        if on_result is not None:
+            on_result(result)
+        if done < len(items) and time.monotonic() - last_report >= PROGRESS_INTERVAL:
+            print_log(f'{done}/{len(items)} ({done * 100 // len(items)}%)', title=f'Progresso {name}', level=2)
+            last_report = time.monotonic()
+
+    return results
+
+def imap_bounded(func, items, window = None, name = None):
+    # Como pool.imap (resultados em ordem), mas com no máximo `window` tarefas em voo,
+    # para que resultados grandes não se acumulem na memória do processo principal
+    name = name or func.__name__
+    executor = get_executor(name)
+    window = window or get_pool_size() * 2
+    task, dispatch = traced(name, func)
+    pending = deque()
+
+    with stage(name, cat='dispatch', id=dispatch, executor=resolve_backend(name)):
+        for item in items:
+            pending.append(executor.apply_async(task, (item,)))
+            if len(pending) >= window:
+                yield pending.popleft().get()
+
+        while pending:
+            yield pending.popleft().get()
+
+atexit.register(shutdown_pool)